@@ -41,6 +41,8 @@ const Comment = ({
 	const [showReplies, setShowReplies] = useState(false);
 	// const [replies, setReplies] = useState<CommentType[]>([]);
 	const [loadingReplies, setLoadingReplies] = useState(false);
+	// Cursor of the next page of replies, null once they are all shown
+	const [repliesCursor, setRepliesCursor] = useState<string | null>(null);
 
 	const axiosPrivate = useAxiosPrivate();
 
@@ -78,9 +80,10 @@ const Comment = ({
 					type: CommentActionTypes.INIT_REPLIES,
 					payload: {
 						commentId: commentId,
-						replies: res.data,
+						replies: res.data.replies,
 					},
 				});
+				setRepliesCursor(res.data.next_cursor);
 			} catch (error) {
 				console.log(error);
 			} finally {
@@ -89,6 +92,30 @@ const Comment = ({
 		}
 	};
 
+	// Handle More Replies
+	const handleMoreReplies = async (commentId: number) => {
+		if (!repliesCursor || loadingReplies) return;
+		try {
+			setLoadingReplies(true);
+			const res = await axiosPrivate.get(
+				`/api/posts/comments/${commentId}/replies`,
+				{ params: { cursor: repliesCursor } }
+			);
+			dispatch({
+				type: CommentActionTypes.ADD_REPLIES,
+				payload: {
+					commentId: commentId,
+					replies: res.data.replies,
+				},
+			});
+			setRepliesCursor(res.data.next_cursor);
+		} catch (error) {
+			console.log(error);
+		} finally {
+			setLoadingReplies(false);
+		}
+	};
+
 	// Handle Like Comment
 	const handleLike = async () => {
 		console.log("Like" + " " + comment.content);
@@ -223,6 +250,18 @@ const Comment = ({
 								key={idx}
 							/>
 						))}
+						{repliesCursor && (
+							<button
+								onClick={() => handleMoreReplies(comment.id)}
+								disabled={loadingReplies}
+								className="text-xs text-gray-400 hover:text-gray-300 flex items-center"
+							>
+								<span className="w-[30px] h-[1px] bg-slate-400 inline-block "></span>
+								<span className="mx-2">
+									{loadingReplies ? "Loading..." : "View more replies"}
+								</span>
+							</button>
+						)}
 					</div>
 				)}
 		</div>
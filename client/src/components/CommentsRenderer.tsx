@@ -1,4 +1,4 @@
-import React, { useEffect } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import { AvatarMakerSmall } from "../pages/PostPage";
 import { Link } from "react-router-dom";
 import Comment from "./Comment";
@@ -34,6 +34,11 @@ const CommentsRenderer: React.FC<Props> = ({
 }) => {
 	const axiosPrivate = useAxiosPrivate();
 
+	// Cursor of the next page of comments, null once they are all shown
+	const [nextCursor, setNextCursor] = useState<string | null>(null);
+	const [loadingMore, setLoadingMore] = useState(false);
+	const loadedMore = useRef(false);
+
 	useEffect(() => {
 		let isMounted = true;
 		const controller = new AbortController();
@@ -42,11 +47,20 @@ const CommentsRenderer: React.FC<Props> = ({
 				const res = await axiosPrivate.get(`/api/posts/${post.id}/comments`, {
 					signal: controller.signal,
 				});
-				isMounted &&
+				if (!isMounted) return;
+				if (loadedMore.current) {
+					// Keep the pages loaded after the first one
+					dispatch({
+						type: CommentActionTypes.REFRESH_COMMENTS,
+						payload: { comments: res.data.comments },
+					});
+				} else {
 					dispatch({
 						type: CommentActionTypes.SET_COMMENTS,
 						payload: { comments: res.data.comments, isLoading: false },
 					});
+					setNextCursor(res.data.next_cursor);
+				}
 			} catch (error) {
 				// Todo Error Remove
 				console.error(error);
@@ -69,6 +83,26 @@ const CommentsRenderer: React.FC<Props> = ({
 		};
 	}, []);
 
+	const handleLoadMore = async () => {
+		if (!nextCursor || loadingMore) return;
+		try {
+			setLoadingMore(true);
+			const res = await axiosPrivate.get(`/api/posts/${post.id}/comments`, {
+				params: { cursor: nextCursor },
+			});
+			loadedMore.current = true;
+			dispatch({
+				type: CommentActionTypes.ADD_COMMENTS,
+				payload: { comments: res.data.comments },
+			});
+			setNextCursor(res.data.next_cursor);
+		} catch (error) {
+			console.error(error);
+		} finally {
+			setLoadingMore(false);
+		}
+	};
+
 	return (
 		<section className="max-h-[300px] md:block overflow-y-auto lg:max-h-full px-3">
 			{/* Description */}
@@ -132,6 +166,15 @@ const CommentsRenderer: React.FC<Props> = ({
 					No Comments Yet
 				</span>
 			)}
+			{!commentsState.isLoading && nextCursor && (
+				<button
+					onClick={handleLoadMore}
+					disabled={loadingMore}
+					className="block w-full text-center py-4 text-sm text-gray-400 hover:text-gray-300"
+				>
+					{loadingMore ? "Loading..." : "Load more comments"}
+				</button>
+			)}
 		</section>
 	);
 };
@@ -1,4 +1,4 @@
-import { useEffect } from "react";
+import { useEffect, useState } from "react";
 import { useLocation } from "react-router-dom";
 import useAuth from "../hooks/useAuth";
 import useAxiosPrivate from "../hooks/useAxiosPrivate";
@@ -18,6 +18,10 @@ const Posts = () => {
 		appDispatch,
 	} = useApp();
 
+	// Cursor of the next page, null once the feed is exhausted
+	const [nextCursor, setNextCursor] = useState<string | null>(null);
+	const [loadingMore, setLoadingMore] = useState(false);
+
 	useEffect(() => {
 		useDocumentTitle("Photon");
 		let isMounted = true;
@@ -29,11 +33,13 @@ const Posts = () => {
 					signal: controller.signal,
 				});
 
-				isMounted &&
+				if (isMounted) {
 					appDispatch({
 						type: AppReducerActions.INIT_POSTS,
-						payload: { posts: res.data },
+						payload: { posts: res.data.posts },
 					});
+					setNextCursor(res.data.next_cursor);
+				}
 			} catch (error: any) {
 				if (error?.response?.status === 401) {
 					logout(location);
@@ -52,6 +58,30 @@ const Posts = () => {
 		};
 	}, []);
 
+	const handleLoadMore = async () => {
+		if (!nextCursor || loadingMore) return;
+		try {
+			setLoadingMore(true);
+			const res = await axiosPrivate.get("/api/posts/", {
+				params: { cursor: nextCursor },
+			});
+			appDispatch({
+				type: AppReducerActions.ADD_POSTS,
+				payload: { posts: res.data.posts },
+			});
+			setNextCursor(res.data.next_cursor);
+		} catch (error: any) {
+			if (error?.response?.status === 401) {
+				logout(location);
+				return;
+			}
+
+			console.log(error);
+		} finally {
+			setLoadingMore(false);
+		}
+	};
+
 	return (
 		<div className="container mx-auto max-w-3xl py-20">
 			<div className="flex flex-col items-center gap-4">
@@ -64,6 +94,15 @@ const Posts = () => {
 				) : (
 					homePosts.map((post, id) => <Post post={post} key={id} />)
 				)}
+				{nextCursor && (
+					<button
+						onClick={handleLoadMore}
+						disabled={loadingMore}
+						className="text-sm text-gray-400 hover:text-gray-300 py-4"
+					>
+						{loadingMore ? "Loading..." : "Load more"}
+					</button>
+				)}
 			</div>
 		</div>
 	);
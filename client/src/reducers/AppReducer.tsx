@@ -5,6 +5,7 @@ export interface AppReducerState {
 
 export enum AppReducerActions {
 	INIT_POSTS = "INIT_POSTS",
+	ADD_POSTS = "ADD_POSTS",
 	RESET_HOME_POSTS = "RESET_HOME_POSTS",
 	SET_ERRORS = "SET_ERRORS",
 	RESET_ERRORS = "RESET_ERRORS",
@@ -16,6 +17,12 @@ interface InitPostAction {
 		posts: PostType[];
 	};
 }
+interface AddPostsAction {
+	type: AppReducerActions.ADD_POSTS;
+	payload: {
+		posts: PostType[];
+	};
+}
 interface ResetHomePosts {
 	type: AppReducerActions.RESET_HOME_POSTS;
 }
@@ -32,6 +39,7 @@ interface ResetErrorsAction {
 
 export type AppActions =
 	| InitPostAction
+	| AddPostsAction
 	| SetErrorsAction
 	| ResetErrorsAction
 	| ResetHomePosts;
@@ -45,6 +53,11 @@ const AppReducer = (
 			return { ...state, homePosts: action.payload.posts };
 		}
 
+		// Next page of the feed
+		case AppReducerActions.ADD_POSTS: {
+			return { ...state, homePosts: [...state.homePosts, ...action.payload.posts] };
+		}
+
 		case AppReducerActions.RESET_HOME_POSTS: {
 			return { ...state, homePosts: [] };
 		}
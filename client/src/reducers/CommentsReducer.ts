@@ -10,9 +10,11 @@ export type CommentReducerState = {
 export enum CommentActionTypes {
 	SET_COMMENTS = "SET_COMMENTS",
 	ADD_COMMENTS = "ADD_COMMENTS",
+	REFRESH_COMMENTS = "REFRESH_COMMENTS",
 	COMMENTS_ERROR = "COMMENTS_ERROR",
 	ADD_COMMENT = "ADD_COMMENT",
 	INIT_REPLIES = "INIT_REPLIES",
+	ADD_REPLIES = "ADD_REPLIES",
 	ADD_REPLY = "ADD_REPLY",
 	LIKE_COMMENT = "LIKE_COMMENT",
 	DISLIKE_COMMENT = "DISLIKE_COMMENT",
@@ -35,6 +37,13 @@ type AddCommentsAction = {
 	};
 };
 
+type RefreshCommentsAction = {
+	type: CommentActionTypes.REFRESH_COMMENTS;
+	payload: {
+		comments: CommentType[];
+	};
+};
+
 type AddCommentAction = {
 	type: CommentActionTypes.ADD_COMMENT;
 	payload: {
@@ -56,6 +65,13 @@ type InitCommentRepliesAction = {
 		replies: CommentType[];
 	};
 };
+type AddCommentRepliesAction = {
+	type: CommentActionTypes.ADD_REPLIES;
+	payload: {
+		commentId: number;
+		replies: CommentType[];
+	};
+};
 type AddCommentReplyAction = {
 	type: CommentActionTypes.ADD_REPLY;
 	payload: {
@@ -108,8 +124,10 @@ export type CommentActions =
 	| SetCommentsAction
 	| SetCommentsErrorAction
 	| AddCommentsAction
+	| RefreshCommentsAction
 	| AddCommentAction
 	| InitCommentRepliesAction
+	| AddCommentRepliesAction
 	| AddCommentReplyAction
 	| LikeCommentAction
 	| DisLikeCommentAction
@@ -138,6 +156,26 @@ export const CommentsReducer = (
 				errMsg: "",
 			};
 
+		// Periodic refetch of the first page. Comments already shown are updated in place and
+		// new ones go on top, so the older pages the user loaded stay
+		case CommentActionTypes.REFRESH_COMMENTS: {
+			const shownIds = new Set(state.comments.map((comment) => comment.id));
+			const fresh = new Map(
+				action.payload.comments.map((comment) => [comment.id, comment])
+			);
+			return {
+				...state,
+				comments: [
+					...action.payload.comments.filter(
+						(comment) => !shownIds.has(comment.id)
+					),
+					...state.comments.map((comment) => fresh.get(comment.id) ?? comment),
+				],
+				isLoading: false,
+				errMsg: "",
+			};
+		}
+
 		case CommentActionTypes.COMMENTS_ERROR:
 			return {
 				...state,
@@ -161,6 +199,18 @@ export const CommentsReducer = (
 				},
 			};
 
+		case CommentActionTypes.ADD_REPLIES:
+			return {
+				...state,
+				replies: {
+					...state.replies,
+					[action.payload.commentId]: [
+						...(state.replies[action.payload.commentId] || []),
+						...action.payload.replies,
+					],
+				},
+			};
+
 		case CommentActionTypes.ADD_REPLY:
 			const existingReplies = state.replies[action.payload.commentId] || [];
 			const newReplies = [...existingReplies, ...[action.payload.reply]];
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Post, UserProfile, Comment, SavedPost, Tag
+from .models import Post, UserProfile, Comment, SavedPost, Tag, ImageJob
 # Register your models here.
 admin.site.register(Tag)
 admin.site.register(UserProfile)
@@ -7,3 +7,4 @@ admin.site.register(SavedPost)
 admin.site.register(Post)
 admin.site.register(Comment)
 
+admin.site.register(ImageJob)
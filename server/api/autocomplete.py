@@ -0,0 +1,236 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Q
+
+
+# Results kept per prefix, also the most a single lookup can return
+MAX_RESULTS = 20
+# Prefixes up to this long are ranked when the index is built, their ranges are too wide to
+# scan on a lookup
+PRECOMPUTED_PREFIX_LENGTH = 2
+# Every process rebuilds its indexes from the database this often, which also picks up
+# changes other worker processes made
+REBUILD_SECONDS = getattr(settings, "AUTOCOMPLETE_REBUILD_SECONDS", 900)
+
+_KEY_SEPARATOR = "\x00"
+_MAX_CHAR = chr(0x10FFFF)
+
+
+class PrefixIndex:
+    """
+    Sorted array of lower cased "<text>\\0<id>" keys with a score per id. A prefix is the
+    bisect range of the keys that start with it, and the best MAX_RESULTS of that range by
+    (-score, text) are cached per prefix. Score updates patch the cached lists in place,
+    so hot prefixes stay cached while counts keep moving.
+
+    The lists of the short prefixes are filled in one pass when the index is built and kept
+    until the next build: an entry outside one of them that a lowered score would now let in
+    only shows up after the rebuild.
+    """
+
+    def __init__(self, rows=()):
+        self._entries = {}  # id -> (text, score)
+        self._keys = []
+        self._top = {}  # prefix -> best ids, best first
+        self._lock = threading.Lock()
+        for entry_id, text, score in rows:
+            self._entries[entry_id] = (text, score)
+        self._keys = sorted(self._key(entry_id, text) for entry_id, (text, _) in self._entries.items())
+
+        for entry_id in sorted(self._entries, key=self._rank):
+            lowered = self._entries[entry_id][0].lower()
+            for end in range(1, min(len(lowered), PRECOMPUTED_PREFIX_LENGTH) + 1):
+                top = self._top.setdefault(lowered[:end], [])
+                if len(top) < MAX_RESULTS:
+                    top.append(entry_id)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, entry_id):
+        return entry_id in self._entries
+
+    def search(self, prefix, limit):
+        prefix = prefix.lower()
+        with self._lock:
+            top = self._top.get(prefix)
+            if top is None:
+                lo = bisect_left(self._keys, prefix)
+                hi = bisect_left(self._keys, prefix + _MAX_CHAR, lo)
+                ids = (self._id_of(self._keys[i]) for i in range(lo, hi))
+                top = self._top[prefix] = heapq.nsmallest(MAX_RESULTS, ids, key=self._rank)
+            return [(entry_id, *self._entries[entry_id]) for entry_id in top[:limit]]
+
+    def upsert(self, entry_id, text, score=None):
+        with self._lock:
+            old = self._entries.get(entry_id)
+            if score is None:
+                score = old[1] if old else 0
+            renamed = old is not None and old[0] != text
+            if renamed:
+                self._remove(entry_id)
+            self._entries[entry_id] = (text, score)
+            if old is None or renamed:
+                insort(self._keys, self._key(entry_id, text))
+            self._refresh_prefixes(entry_id, text, dropped=old is not None and not renamed and score < old[1])
+
+    def adjust(self, entry_id, delta):
+        with self._lock:
+            if entry_id not in self._entries:
+                return
+            text, score = self._entries[entry_id]
+            self._entries[entry_id] = (text, max(score + delta, 0))
+            self._refresh_prefixes(entry_id, text, dropped=delta < 0)
+
+    def remove(self, entry_id):
+        with self._lock:
+            self._remove(entry_id)
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        key = self._key(entry_id, entry[0])
+        position = bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            del self._keys[position]
+        self._refresh_prefixes(entry_id, entry[0], dropped=True)
+
+    # Keep the cached top lists of every prefix of `text` right after `entry_id` changed
+    def _refresh_prefixes(self, entry_id, text, dropped):
+        lowered = text.lower()
+        for end in range(1, len(lowered) + 1):
+            prefix = lowered[:end]
+            top = self._top.get(prefix)
+            if top is None:
+                continue
+            complete = len(top) < MAX_RESULTS
+            if entry_id in top:
+                top.remove(entry_id)
+                # A lower ranked id outside the cached list may now belong in it
+                if dropped and not complete and len(prefix) > PRECOMPUTED_PREFIX_LENGTH:
+                    del self._top[prefix]
+                    continue
+            if entry_id in self._entries:
+                top.append(entry_id)
+                top.sort(key=self._rank)
+                del top[MAX_RESULTS:]
+
+    def _rank(self, entry_id):
+        text, score = self._entries[entry_id]
+        return (-score, text.lower(), entry_id)
+
+    @staticmethod
+    def _key(entry_id, text):
+        return f"{text.lower()}{_KEY_SEPARATOR}{entry_id}"
+
+    @staticmethod
+    def _id_of(key):
+        return int(key.rsplit(_KEY_SEPARATOR, 1)[1])
+
+
+class AutocompleteIndex:
+    """
+    Lazily built PrefixIndex for one kind of row. The first lookup in a process builds it,
+    later rebuilds run in a background thread and swap the new index in when done. Updates
+    that arrive while a rebuild is loading are replayed onto the new index before it is
+    swapped in, since the load may or may not have seen them.
+    """
+
+    def __init__(self, load_rows):
+        self._load_rows = load_rows
+        self._index = None
+        self._built_at = 0
+        self._pending = None
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = PrefixIndex(self._load_rows())
+                    self._built_at = time.monotonic()
+        elif time.monotonic() - self._built_at > REBUILD_SECONDS and self._pending is None:
+            self._pending = []
+            threading.Thread(target=self._rebuild, daemon=True).start()
+        return self._index
+
+    # Incremental updates only matter to a process that has built its index already
+    @property
+    def loaded(self):
+        return self._index
+
+    # Call PrefixIndex.<method>(*args) on the current index, and on the one being rebuilt
+    def apply(self, method, *args):
+        if self._index is None:
+            return
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((method, args))
+            getattr(self._index, method)(*args)
+
+    def _rebuild(self):
+        try:
+            index = PrefixIndex(self._load_rows())
+            with self._lock:
+                for method, args in self._pending:
+                    getattr(index, method)(*args)
+                self._index, self._built_at = index, time.monotonic()
+        finally:
+            self._pending = None
+            close_old_connections()
+
+
+def _load_users():
+    from django.contrib.auth.models import User
+
+    return User.objects.order_by().values_list("id", "username", "userprofile__followers_count").iterator()
+
+
+def _load_tags():
+    from .models import VISIBILITY_PUBLIC, Tag
+
+    # Close friends posts don't reveal their tags to everyone else
+    score = Count("post", filter=Q(post__visibility=VISIBILITY_PUBLIC))
+    return Tag.objects.order_by().annotate(score=score).values_list("id", "name", "score").iterator()
+
+
+users = AutocompleteIndex(_load_users)
+tags = AutocompleteIndex(_load_tags)
+
+
+# Hooks called from model signals and Post.save
+
+def user_saved(user):
+    users.apply("upsert", user.pk, user.username)
+
+
+def user_deleted(user_id):
+    users.apply("remove", user_id)
+
+
+def followers_changed(user_ids, delta):
+    for user_id in user_ids:
+        users.apply("adjust", user_id, delta)
+
+
+def tags_changed(added, removed):
+    index = tags.loaded
+    if index is None:
+        return
+
+    from .models import Tag
+
+    new_ids = [tag_id for tag_id in added if tag_id not in index]
+    for tag_id, name in Tag.objects.filter(id__in=new_ids).values_list("id", "name"):
+        tags.apply("upsert", tag_id, name)
+    for tag_id in added:
+        tags.apply("adjust", tag_id, 1)
+    for tag_id in removed:
+        tags.apply("adjust", tag_id, -1)
@@ -0,0 +1,171 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+# Every process rebuilds the graph from the database this often, folding in the follows it
+# applied incrementally and picking up the ones other worker processes wrote
+REBUILD_SECONDS = getattr(settings, "FOLLOW_GRAPH_REBUILD_SECONDS", 900)
+MAX_SUGGESTIONS = 50
+
+
+class FollowGraph:
+    """
+    Who-follows-whom in compressed sparse row form. The users followed by user id `u` are
+    targets[offsets[u]:offsets[u + 1]], sorted. User ids index `offsets` directly, so the graph
+    costs 8 bytes per user id plus 4 bytes per follow, with no per-object overhead.
+
+    The arrays are never resized. Follows and unfollows applied after the build go to small
+    per-user overlay sets until the next rebuild folds them in.
+    """
+
+    def __init__(self, edges=()):
+        offsets = array("q", [0])
+        targets = array("i")
+        current = 0
+        for follower_id, followed_id in edges:
+            while current < follower_id:
+                offsets.append(len(targets))
+                current += 1
+            targets.append(followed_id)
+        offsets.append(len(targets))
+
+        self._offsets = offsets
+        self._targets = targets
+        self._added = defaultdict(set)
+        self._removed = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._targets) + sum(map(len, self._added.values())) - sum(map(len, self._removed.values()))
+
+    def following(self, user_id):
+        with self._lock:
+            return self._following(user_id)
+
+    def follow(self, follower_id, followed_id):
+        with self._lock:
+            if followed_id in self._removed.get(follower_id, ()):
+                self._removed[follower_id].discard(followed_id)
+            elif not self._in_base(follower_id, followed_id):
+                self._added[follower_id].add(followed_id)
+
+    def unfollow(self, follower_id, followed_id):
+        with self._lock:
+            if followed_id in self._added.get(follower_id, ()):
+                self._added[follower_id].discard(followed_id)
+            elif self._in_base(follower_id, followed_id):
+                self._removed[follower_id].add(followed_id)
+
+    def suggestions(self, user_id, limit, extra_sources=()):
+        """
+        Friends of friends of `user_id` ranked by how many of the people the user follows also
+        follow them, as [(user id, mutuals)]. `extra_sources` are more users to count as known
+        besides the followed ones, e.g. close friends.
+        """
+        with self._lock:
+            known = set(self._following(user_id))
+            known.update(extra_sources)
+            mutuals = Counter()
+            for friend_id in known:
+                mutuals.update(self._following(friend_id))
+
+        for excluded in known | {user_id}:
+            mutuals.pop(excluded, None)
+        return heapq.nsmallest(limit, mutuals.items(), key=lambda item: (-item[1], item[0]))
+
+    def _following(self, user_id):
+        if 0 <= user_id < len(self._offsets) - 1:
+            base = self._targets[self._offsets[user_id]:self._offsets[user_id + 1]]
+        else:
+            base = array("i")
+        added, removed = self._added.get(user_id, ()), self._removed.get(user_id, ())
+        if not added and not removed:
+            return base
+        return [target for target in base if target not in removed] + list(added)
+
+    def _in_base(self, follower_id, followed_id):
+        if not 0 <= follower_id < len(self._offsets) - 1:
+            return False
+        lo, hi = self._offsets[follower_id], self._offsets[follower_id + 1]
+        position = bisect_left(self._targets, followed_id, lo, hi)
+        return position < hi and self._targets[position] == followed_id
+
+
+class GraphHolder:
+    """
+    Lazily built FollowGraph. The first lookup in a process builds it, later rebuilds run in
+    a background thread. Changes that arrive while a rebuild is loading are replayed onto the
+    new graph before it is swapped in, since the load may or may not have seen them.
+    """
+
+    def __init__(self, load_edges):
+        self._load_edges = load_edges
+        self._graph = None
+        self._built_at = 0
+        self._pending = None
+        self._lock = threading.Lock()
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            with self._lock:
+                if self._graph is None:
+                    self._graph = FollowGraph(self._load_edges())
+                    self._built_at = time.monotonic()
+        elif time.monotonic() - self._built_at > REBUILD_SECONDS and self._pending is None:
+            self._pending = []
+            threading.Thread(target=self._rebuild, daemon=True).start()
+        return self._graph
+
+    def apply(self, pairs, delta):
+        if self._graph is None:
+            return
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((pairs, delta))
+            _apply(self._graph, pairs, delta)
+
+    def _rebuild(self):
+        try:
+            graph = FollowGraph(self._load_edges())
+            with self._lock:
+                for pairs, delta in self._pending:
+                    _apply(graph, pairs, delta)
+                self._graph, self._built_at = graph, time.monotonic()
+        finally:
+            self._pending = None
+            close_old_connections()
+
+
+def _apply(graph, pairs, delta):
+    for follower_id, followed_id in pairs:
+        if delta > 0:
+            graph.follow(follower_id, followed_id)
+        else:
+            graph.unfollow(follower_id, followed_id)
+
+
+def _load_edges():
+    from .models import UserProfile
+
+    return (
+        UserProfile.following.through.objects
+        .order_by("userprofile__user_id", "user_id")
+        .values_list("userprofile__user_id", "user_id")
+        .iterator(chunk_size=10000)
+    )
+
+
+holder = GraphHolder(_load_edges)
+
+
+# Hook called by follows.record_follows once the follow rows are committed
+def follows_changed(pairs, delta):
+    holder.apply(pairs, delta)
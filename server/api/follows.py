@@ -0,0 +1,118 @@
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .models import UserProfile
+
+
+# Follows are written to the UserProfile.following through table directly, one row at a time
+# like likes.py, and the stored counters move by the rows written in the same transaction.
+
+# Most users a single bulk follow or relationship lookup may name
+MAX_BATCH = 100
+
+
+def follow(profile, user_ids):
+    """Make `profile` follow every user in `user_ids`. Returns the ids that were not followed yet."""
+    through = UserProfile.following.through
+    user_ids = set(user_ids) - {profile.user_id}
+    if not user_ids:
+        return []
+
+    with transaction.atomic():
+        already = set(through.objects.filter(userprofile_id=profile.pk, user_id__in=user_ids).values_list("user_id", flat=True))
+        # One insert per row so the counters only move for the rows this call wrote, a concurrent
+        # identical request gets the unique constraint instead
+        added = []
+        for user_id in sorted(user_ids - already):
+            try:
+                with transaction.atomic():
+                    through.objects.create(userprofile_id=profile.pk, user_id=user_id)
+            except IntegrityError:
+                continue  # already followed
+            added.append(user_id)
+        record_follows([(profile.user_id, user_id) for user_id in added], 1)
+    return added
+
+
+def unfollow(profile, user_ids):
+    """Make `profile` stop following the users in `user_ids`. Returns the ids that were followed."""
+    rows = UserProfile.following.through.objects.filter(userprofile_id=profile.pk)
+
+    with transaction.atomic():
+        removed = []
+        for user_id in sorted(rows.filter(user_id__in=set(user_ids)).values_list("user_id", flat=True)):
+            # Only rows this call deleted count, a concurrent unfollow may have got there first
+            deleted, _ = rows.filter(user_id=user_id).delete()
+            if deleted:
+                removed.append(user_id)
+        record_follows([(profile.user_id, user_id) for user_id in removed], -1)
+    return removed
+
+
+def relationships(user_id, other_ids):
+    """
+    How user `user_id` relates to each of `other_ids`, as {id: {"following", "followed_by",
+    "close_friend"}}. All three relations are read in one UNION query.
+    """
+    other_ids = set(other_ids)
+    following = UserProfile.following.through.objects
+    close_friends = UserProfile.close_friends.through.objects
+    rows = (
+        following.filter(userprofile__user_id=user_id, user_id__in=other_ids)
+        .values_list("user_id", Value("following"))
+        .union(
+            following.filter(user_id=user_id, userprofile__user_id__in=other_ids).values_list("userprofile__user_id", Value("followed_by")),
+            close_friends.filter(userprofile__user_id=user_id, user_id__in=other_ids).values_list("user_id", Value("close_friend")),
+            all=True,
+        )
+    )
+
+    result = {other_id: {"following": False, "followed_by": False, "close_friend": False} for other_id in other_ids}
+    for other_id, relation in rows:
+        result[other_id][relation] = True
+    return result
+
+
+def record_follows(pairs, delta):
+    """
+    Bookkeeping for (follower user id, followed user id) pairs that were just followed (delta 1)
+    or unfollowed (delta -1): the stored counters now, the in-process follow graph, home timelines
+    and autocomplete ranking once the transaction commits.
+    """
+    if not pairs:
+        return
+
+    _move_counter("following_count", Counter(follower_id for follower_id, _ in pairs), delta)
+    _move_counter("followers_count", Counter(followed_id for _, followed_id in pairs), delta)
+
+    transaction.on_commit(lambda: _after_commit(pairs, delta))
+
+
+# One UPDATE per distinct amount, usually a single one
+def _move_counter(field, amounts, delta):
+    by_amount = defaultdict(list)
+    for user_id, amount in amounts.items():
+        by_amount[amount * delta].append(user_id)
+    for change, user_ids in by_amount.items():
+        UserProfile.objects.filter(user_id__in=user_ids).update(**{field: Greatest(F(field) + change, 0)})
+
+
+def _after_commit(pairs, delta):
+    from . import autocomplete, follow_graph, timelines
+
+    follow_graph.follows_changed(pairs, delta)
+
+    followed_by_follower = defaultdict(list)
+    for follower_id, followed_id in pairs:
+        followed_by_follower[follower_id].append(followed_id)
+    for follower_id, followed_ids in followed_by_follower.items():
+        if delta > 0:
+            timelines.backfill(follower_id, followed_ids)
+        else:
+            timelines.purge(follower_id, followed_ids)
+
+    for followed_id, amount in Counter(followed_id for _, followed_id in pairs).items():
+        autocomplete.followers_changed([followed_id], amount * delta)
@@ -0,0 +1,380 @@
+import base64
+import hashlib
+import io
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import IMAGE_FAILED, IMAGE_PENDING, IMAGE_PROCESSING, IMAGE_READY, ImageBlob, ImageJob, Post, UserProfile
+
+
+logger = logging.getLogger(__name__)
+
+# Jobs decoded and encoded at the same time per worker process. Pillow releases the GIL
+# while it resizes and encodes, so threads run in parallel.
+WORKERS = getattr(settings, "IMAGE_WORKERS", 2)
+MAX_ATTEMPTS = getattr(settings, "IMAGE_JOB_MAX_ATTEMPTS", 5)
+# Delay before the first retry, doubled after every further failure
+RETRY_SECONDS = getattr(settings, "IMAGE_JOB_RETRY_SECONDS", 30)
+# A running job claimed longer ago than this belonged to a worker that died, it is run again
+LOCK_SECONDS = getattr(settings, "IMAGE_JOB_LOCK_SECONDS", 600)
+POLL_SECONDS = 2
+
+# Widths generated for every upload, clients pick one with srcset
+RENDITION_WIDTHS = getattr(settings, "IMAGE_RENDITION_WIDTHS", [150, 320, 640, 1080])
+PROFILE_RENDITION_WIDTHS = getattr(settings, "IMAGE_PROFILE_RENDITION_WIDTHS", [48, 150, 320])
+RENDITIONS_DIR = "renditions"
+RENDITION_QUALITY = 80
+# Largest side of the stored image itself
+MAX_DIMENSION = 500
+# EXIF orientations that turn the picture by 90 degrees, width and height swap when applied
+ORIENTATION_TAG = 0x0112
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def open_image(path):
+    """Decode an upload once, upright and in a mode every encoder used here accepts."""
+    with Image.open(path) as image:
+        image.load()
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        return image
+
+
+def make_renditions(image, name, widths):
+    """
+    Write a WebP copy of the decoded `image` for every width in `widths` narrower than it,
+    as renditions/<name without extension>_<width>.webp. Each one is downscaled from the next
+    larger one rather than from the full upload. Returns their metadata, smallest first.
+    """
+    stem = os.path.splitext(name)[0]
+    renditions = []
+    source = image
+    for width in sorted((width for width in widths if width < image.width), reverse=True):
+        height = max(1, round(image.height * width / image.width))
+        source = source.resize((width, height), resample=Image.LANCZOS)
+        buffer = io.BytesIO()
+        source.save(buffer, "WEBP", quality=RENDITION_QUALITY, method=4)
+
+        rendition_name = f"{RENDITIONS_DIR}/{stem}_{width}.webp"
+        default_storage.delete(rendition_name)
+        rendition_name = default_storage.save(rendition_name, ContentFile(buffer.getvalue()))
+        renditions.append({"name": rendition_name, "width": width, "height": height, "size": buffer.tell()})
+    return renditions[::-1]
+
+
+def compress_post_image(image, path, format):
+    # Resize the image if it exceeds the maximum dimension
+    if image.width > MAX_DIMENSION or image.height > MAX_DIMENSION:
+        image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), resample=Image.BICUBIC)
+
+    # Convert the image to WebP format with compression
+    image.save(path, "WEBP", method=6, quality=90)
+
+
+def resize_profile_image(image, path, format):
+    if image.width > MAX_DIMENSION or image.height > MAX_DIMENSION:
+        image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), resample=Image.BICUBIC)
+        # Kept in the format it was uploaded in, which the stored name may have no extension for
+        image.save(path, format, optimize=True, quality=85)
+
+
+# Preview shown while the image loads: a data uri of the image this wide, and its dominant color
+PLACEHOLDER_WIDTH = 20
+PLACEHOLDER_QUALITY = 30
+PALETTE_COLORS = 8
+
+
+def make_preview(image):
+    """(placeholder data uri, dominant "#rrggbb") from the decoded `image`."""
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    tiny = image.resize((PLACEHOLDER_WIDTH, height), resample=Image.BOX)
+    buffer = io.BytesIO()
+    tiny.save(buffer, "WEBP", quality=PLACEHOLDER_QUALITY)
+    placeholder = "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+    # Most common color of a small palette
+    palette = tiny.convert("RGB").quantize(colors=PALETTE_COLORS)
+    _, index = max(palette.getcolors())
+    red, green, blue = palette.getpalette()[index * 3:index * 3 + 3]
+    return placeholder, f"#{red:02x}{green:02x}{blue:02x}"
+
+
+# kind -> (rendition widths, how the stored image itself is rewritten, formats it is stored in)
+PROCESSORS = {
+    ImageJob.POST_IMAGE: (RENDITION_WIDTHS, compress_post_image, {"WEBP"}),
+    ImageJob.PROFILE_IMAGE: (PROFILE_RENDITION_WIDTHS, resize_profile_image, None),
+}
+
+
+def read_header(upload):
+    """(width, height, format) of an upload as displayed, read from its header without decoding pixels."""
+    try:
+        with Image.open(upload) as image:
+            width, height = image.size
+            if image.getexif().get(ORIENTATION_TAG) in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+            return width, height, image.format
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None, None, ""
+    finally:
+        upload.seek(0)
+
+
+def needs_processing(kind, width, height, format):
+    """Whether a job has anything to do for an upload, judged from its header alone."""
+    widths, _, formats = PROCESSORS[kind]
+    if width is None:
+        return True
+    if any(rendition_width < width for rendition_width in widths):
+        return True
+    if formats is not None and format not in formats:
+        return True
+    return max(width, height) > MAX_DIMENSION
+
+
+# Content addressed uploads
+
+def content_hash(upload):
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+# Blob state copied onto the rows using the blob, so serializing them needs no join.
+# kind -> (model, image field, {row field: blob field})
+COPIED_FIELDS = {
+    ImageJob.POST_IMAGE: (Post, "image", {
+        "image_status": "status",
+        "image_renditions": "renditions",
+        "image_width": "width",
+        "image_height": "height",
+        "image_placeholder": "placeholder",
+        "image_dominant_color": "dominant_color",
+    }),
+    ImageJob.PROFILE_IMAGE: (UserProfile, "profile_image", {
+        "profile_image_renditions": "renditions",
+        "profile_image_width": "width",
+        "profile_image_height": "height",
+        "profile_image_placeholder": "placeholder",
+        "profile_image_dominant_color": "dominant_color",
+    }),
+}
+
+
+def sync_upload(instance, kind):
+    """
+    Called from save() inside its transaction, before the row is written. A new upload in the
+    image field of `instance` is pointed at the blob of the same bytes, which is only stored
+    and queued for processing if no upload had those bytes yet, and the blob the field used
+    before is released. The blob is kept in `<field>_blob` and its state copied onto the row.
+    Returns the names of the fields it changed, empty if the image did not change.
+    """
+    _, field, copied = COPIED_FIELDS[kind]
+    file = getattr(instance, field)
+    blob_field = f"{field}_blob"
+    previous_id = getattr(instance, f"{blob_field}_id")
+
+    if file and file._committed:
+        return []
+    if not file and previous_id is None:
+        return []
+
+    blob = None
+    if file:
+        blob = _blob_for_upload(file, kind, instance._meta.get_field(field).upload_to.path)
+        setattr(instance, field, blob.name)
+        if blob.status == IMAGE_PENDING:
+            # The blob may finish before this transaction commits, the copy on the row would miss it
+            transaction.on_commit(lambda: copy_blob_state(blob.pk))
+    setattr(instance, blob_field, blob)
+    for row_field, source in copied.items():
+        setattr(instance, row_field, getattr(blob, source) if blob else instance._meta.get_field(row_field).get_default())
+
+    if previous_id is not None:
+        release_blob(previous_id)
+    return [field, blob_field, *copied]
+
+
+def _blob_for_upload(upload, kind, directory):
+    digest = content_hash(upload)
+    blob = ImageBlob.objects.filter(kind=kind, sha256=digest).first()
+    if blob is None:
+        width, height, format = read_header(upload)
+        pending = needs_processing(kind, width, height, format)
+        placeholder = dominant_color = ""
+        if not pending:
+            # Small enough to need no job, decoding it for the preview here is cheap
+            placeholder, dominant_color = make_preview(open_image(upload))
+            upload.seek(0)
+        extension = os.path.splitext(upload.name)[1].lower()
+        name = default_storage.save(f"{directory}/{digest}{extension}", upload)
+        try:
+            with transaction.atomic():
+                blob = ImageBlob.objects.create(
+                    kind=kind, sha256=digest, name=name, width=width, height=height, format=format,
+                    placeholder=placeholder, dominant_color=dominant_color,
+                    status=IMAGE_PENDING if pending else IMAGE_READY,
+                )
+                if pending:
+                    ImageJob.enqueue(kind, blob.pk)
+        except IntegrityError:
+            # Someone stored the same bytes at the same time, share theirs
+            default_storage.delete(name)
+            blob = ImageBlob.objects.get(kind=kind, sha256=digest)
+    elif blob.status == IMAGE_FAILED and ImageBlob.objects.filter(pk=blob.pk, status=IMAGE_FAILED).update(status=IMAGE_PENDING):
+        # Uploaded again after its job gave up, give it another round of attempts
+        ImageJob.objects.filter(kind=kind, object_id=blob.pk, status=ImageJob.FAILED).delete()
+        ImageJob.enqueue(kind, blob.pk)
+        blob.status = IMAGE_PENDING
+
+    ImageBlob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") + 1)
+    return blob
+
+
+def release_blob(blob_id):
+    """Drop one reference to a blob. The last one deletes it, its files go once that commits."""
+    ImageBlob.objects.filter(pk=blob_id).update(ref_count=Greatest(F("ref_count") - 1, 0))
+    blob = ImageBlob.objects.filter(pk=blob_id, ref_count=0).first()
+    if blob is None:
+        return
+
+    names = [blob.name] + [rendition["name"] for rendition in blob.renditions]
+    ImageJob.objects.filter(kind=blob.kind, object_id=blob.pk).delete()
+    blob.delete()
+    transaction.on_commit(lambda: [default_storage.delete(name) for name in names])
+
+
+def copy_blob_state(blob_id):
+    """Copy a blob's processing state, renditions and preview onto the posts or profiles using it."""
+    blob = ImageBlob.objects.filter(pk=blob_id).first()
+    if blob is None:
+        return
+    model, field, copied = COPIED_FIELDS[blob.kind]
+    model.objects.filter(**{f"{field}_blob_id": blob_id}).update(
+        **{row_field: getattr(blob, source) for row_field, source in copied.items()}
+    )
+
+
+# What a job does: decode the blob once, write its renditions and preview and rewrite the image itself.
+# Raising asks for a retry.
+
+def process_blob(blob_id):
+    blob = ImageBlob.objects.filter(pk=blob_id).first()
+    if blob is None:
+        return
+
+    widths, rewrite, formats = PROCESSORS[blob.kind]
+    ImageBlob.objects.filter(pk=blob_id).update(status=IMAGE_PROCESSING)
+    copy_blob_state(blob_id)
+
+    path = default_storage.path(blob.name)
+    image = open_image(path)
+    renditions = make_renditions(image, blob.name, widths)
+    placeholder, dominant_color = make_preview(image)
+    # An image stored before the blob table may already be what the rewrite would make, small and
+    # without metadata, and encoding it again would only lose quality
+    rewritten = formats is not None and blob.format in formats and max(image.size) <= MAX_DIMENSION
+    if not rewritten or image.info.get("exif") or image.info.get("xmp"):
+        rewrite(image, path, blob.format or None)
+    ImageBlob.objects.filter(pk=blob_id).update(
+        status=IMAGE_READY, renditions=renditions, width=image.width, height=image.height,
+        placeholder=placeholder, dominant_color=dominant_color,
+    )
+    copy_blob_state(blob_id)
+
+
+def set_blob_status(blob_id, status):
+    ImageBlob.objects.filter(pk=blob_id).update(status=status)
+    copy_blob_state(blob_id)
+
+
+# Queue
+
+def claim_jobs(limit):
+    """
+    Claim up to `limit` due jobs for this worker. The claim is one UPDATE tagged with a token
+    so concurrent workers never run the same job, without needing SELECT ... FOR UPDATE.
+    """
+    now = timezone.now()
+    ImageJob.objects.filter(status=ImageJob.RUNNING, locked_at__lt=now - timedelta(seconds=LOCK_SECONDS)).update(
+        status=ImageJob.PENDING, locked_by=""
+    )
+
+    due = ImageJob.objects.filter(status=ImageJob.PENDING, available_at__lte=now).order_by("available_at", "id")
+    job_ids = list(due.values_list("id", flat=True)[:limit])
+    if not job_ids:
+        return []
+
+    token = uuid4().hex
+    ImageJob.objects.filter(id__in=job_ids, status=ImageJob.PENDING).update(status=ImageJob.RUNNING, locked_by=token, locked_at=now)
+    return list(ImageJob.objects.filter(locked_by=token, status=ImageJob.RUNNING))
+
+
+def run_job(job):
+    """Run one claimed job. Done jobs are deleted, failed ones retried with backoff up to MAX_ATTEMPTS."""
+    try:
+        process_blob(job.object_id)
+    except Exception:
+        attempts = job.attempts + 1
+        error = traceback.format_exc()
+        logger.warning("Image job %s failed, attempt %s of %s", job, attempts, MAX_ATTEMPTS)
+        if attempts >= MAX_ATTEMPTS:
+            ImageJob.objects.filter(pk=job.pk).update(status=ImageJob.FAILED, attempts=attempts, last_error=error, locked_by="")
+            set_blob_status(job.object_id, IMAGE_FAILED)
+        else:
+            retry_at = timezone.now() + timedelta(seconds=RETRY_SECONDS * 2 ** (attempts - 1))
+            ImageJob.objects.filter(pk=job.pk).update(
+                status=ImageJob.PENDING, attempts=attempts, available_at=retry_at, last_error=error, locked_by=""
+            )
+            set_blob_status(job.object_id, IMAGE_PENDING)
+        return False
+    else:
+        ImageJob.objects.filter(pk=job.pk).delete()
+        return True
+    finally:
+        close_old_connections()
+
+
+def run_worker(workers=WORKERS, once=False, poll_seconds=POLL_SECONDS):
+    """
+    Keep at most `workers` jobs running in a thread pool, claiming more as slots free up.
+    With `once` it returns when the queue has no due jobs left. Returns (done, failed).
+    """
+    done = failed = 0
+    running = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-job") as pool:
+        while True:
+            if len(running) < workers:
+                for job in claim_jobs(workers - len(running)):
+                    running.add(pool.submit(run_job, job))
+
+            if not running:
+                if once:
+                    return done, failed
+                time.sleep(poll_seconds)
+                continue
+
+            finished, running = wait(running, timeout=poll_seconds, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future.result():
+                    done += 1
+                else:
+                    failed += 1
@@ -0,0 +1,49 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+
+# Likes on posts and comments go through here so the stored likes_count stays in step with the likes table.
+# Each operation is one insert or delete on the through table, guarded by its (object, user) unique
+# constraint, so the cost does not depend on how many likes the object already has.
+
+def _like_row(obj, user):
+    field = type(obj).likes.field
+    through = field.remote_field.through
+    return through.objects, {f"{field.m2m_field_name()}_id": obj.pk, f"{field.m2m_reverse_field_name()}_id": user.pk}
+
+
+def _likes_count(obj):
+    return type(obj).objects.filter(pk=obj.pk).values_list("likes_count", flat=True).first() or 0
+
+
+# Returns (liked, likes_count), liking twice is a no-op
+def add_like(obj, user):
+    likes, row = _like_row(obj, user)
+    try:
+        with transaction.atomic():
+            likes.create(**row)
+            type(obj).objects.filter(pk=obj.pk).update(likes_count=F("likes_count") + 1)
+    except IntegrityError:
+        pass  # already liked
+    return True, _likes_count(obj)
+
+
+# Returns (liked, likes_count), unliking twice is a no-op
+def remove_like(obj, user):
+    likes, row = _like_row(obj, user)
+    with transaction.atomic():
+        deleted, _ = likes.filter(**row).delete()
+        if deleted:
+            type(obj).objects.filter(pk=obj.pk, likes_count__gt=0).update(likes_count=F("likes_count") - 1)
+    return False, _likes_count(obj)
+
+
+def toggle_like(obj, user):
+    likes, row = _like_row(obj, user)
+    with transaction.atomic():
+        deleted, _ = likes.filter(**row).delete()
+        if deleted:
+            type(obj).objects.filter(pk=obj.pk, likes_count__gt=0).update(likes_count=F("likes_count") - 1)
+    if deleted:
+        return False, _likes_count(obj)
+    return add_like(obj, user)
@@ -0,0 +1,62 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from api.images import COPIED_FIELDS, content_hash, copy_blob_state, read_header
+from api.models import IMAGE_FAILED, IMAGE_PENDING, IMAGE_READY, ImageBlob, ImageJob, Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Give every post and profile image uploaded before the blob table a blob and queue its "
+        "processing, so it gets renditions, dimensions and a placeholder like new uploads"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Count the images without a blob and stop")
+
+    def handle(self, *args, **options):
+        for kind, (model, field, _) in COPIED_FIELDS.items():
+            rows = (
+                model.objects.filter(**{f"{field}_blob__isnull": True})
+                .exclude(**{f"{field}__isnull": True}).exclude(**{field: ""})
+                .order_by("pk").values_list("pk", field)
+            )
+            if options["dry_run"]:
+                self.stdout.write(f"{kind}: {rows.count()} images without a blob")
+                continue
+
+            queued = shared = missing = 0
+            for pk, name in rows.iterator(chunk_size=1000):
+                if not default_storage.exists(name):
+                    missing += 1
+                    if model is Post:
+                        Post.objects.filter(pk=pk).update(image_status=IMAGE_FAILED)
+                    continue
+
+                with default_storage.open(name) as file:
+                    digest = content_hash(file)
+                    width, height, format = read_header(file)
+
+                with transaction.atomic():
+                    # The file is adopted where it is, later copies of the same bytes share it and
+                    # their own files are left to `manage.py gc_media`
+                    blob, created = ImageBlob.objects.get_or_create(kind=kind, sha256=digest, defaults={
+                        "name": name, "width": width, "height": height, "format": format, "status": IMAGE_PENDING,
+                    })
+                    if created:
+                        ImageJob.enqueue(kind, blob.pk)
+                    ImageBlob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") + 1)
+                    model.objects.filter(pk=pk).update(**{field: blob.name, f"{field}_blob": blob})
+
+                if created:
+                    queued += 1
+                else:
+                    shared += 1
+                    if blob.status == IMAGE_READY:
+                        copy_blob_state(blob.pk)
+
+            self.stdout.write(self.style.SUCCESS(
+                f"{kind}: queued {queued} images, {shared} shared an existing blob, {missing} files missing"
+            ))
@@ -0,0 +1,38 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import BooleanField, ExpressionWrapper, Q
+
+from api.models import Post, TimelineEntry, UserProfile, post_visibility_filter
+from api.timelines import BATCH_SIZE, FANOUT_MAX_FOLLOWERS, FEED_ORDERING, TIMELINE_MAX_LENGTH
+
+
+class Command(BaseCommand):
+    help = "Fill every home timeline from the follow graph and the existing posts, for data older than the timelines"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-length", type=int, default=TIMELINE_MAX_LENGTH)
+        parser.add_argument("--after", type=int, default=0, help="Only users with a greater id, to resume an interrupted run")
+
+    def handle(self, *args, **options):
+        # Which accounts are pulled on read instead of fanned out, as fanout_post would decide
+        large = ExpressionWrapper(Q(followers_count__gt=FANOUT_MAX_FOLLOWERS), output_field=BooleanField())
+        UserProfile.objects.update(fanout_on_read=large)
+
+        follows = UserProfile.following.through.objects
+        filled = 0
+        user_ids = User.objects.filter(id__gt=options["after"]).order_by("id").values_list("id", flat=True)
+        for user_id in user_ids.iterator(chunk_size=BATCH_SIZE):
+            pushed = follows.filter(userprofile__user_id=user_id, user__userprofile__fanout_on_read=False).values("user_id")
+            recent = (
+                Post.objects.filter(post_visibility_filter(user_id))
+                .filter(Q(user_id=user_id) | Q(user_id__in=pushed))
+                .order_by(*FEED_ORDERING)
+                .values_list("id", "created")[:options["max_length"]]
+            )
+            entries = [TimelineEntry(user_id=user_id, post_id=post_id, created=created) for post_id, created in recent]
+            TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+            filled += 1
+            if filled % 1000 == 0:
+                self.stdout.write(f"{filled} timelines, last user id {user_id}")
+
+        self.stdout.write(self.style.SUCCESS(f"Filled {filled} timelines"))
@@ -0,0 +1,150 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from api.images import RENDITIONS_DIR
+from api.models import ImageBlob, Post, UserProfile
+
+
+# JSON fields listing rendition files as [{"name", ...}]
+RENDITION_FIELDS = [
+    (ImageBlob, "renditions"),
+    (Post, "image_renditions"),
+    (UserProfile, "profile_image_renditions"),
+]
+
+
+def file_fields():
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, models.FileField):
+                yield model, field
+
+
+def media_directories():
+    """Every directory files are uploaded to, plus the renditions one."""
+    directories = {RENDITIONS_DIR}
+    for model, field in file_fields():
+        upload_to = getattr(field.upload_to, "path", field.upload_to)
+        if isinstance(upload_to, str) and upload_to.strip("/"):
+            directories.add(upload_to.split("%")[0].strip("/"))
+    return sorted(directories)
+
+
+def referenced_names():
+    """Storage names of every file the database points at, streamed in chunks into one set."""
+    names = set()
+    for model, field in file_fields():
+        rows = model._base_manager.exclude(**{field.attname: ""}).exclude(**{f"{field.attname}__isnull": True})
+        names.update(rows.values_list(field.attname, flat=True).iterator(chunk_size=10000))
+    names.update(ImageBlob.objects.values_list("name", flat=True).iterator(chunk_size=10000))
+    for model, field in RENDITION_FIELDS:
+        for renditions in model._base_manager.values_list(field, flat=True).iterator(chunk_size=10000):
+            names.update(rendition["name"] for rendition in renditions or ())
+    return names
+
+
+def walk(root, directory):
+    """(storage name, DirEntry) of every file below `directory`, depth first in name order so a run can resume."""
+    try:
+        entries = sorted(os.scandir(os.path.join(root, directory)), key=lambda entry: entry.name)
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        name = f"{directory}/{entry.name}"
+        if entry.is_dir(follow_symlinks=False):
+            yield from walk(root, name)
+        elif entry.is_file(follow_symlinks=False):
+            yield name, entry
+
+
+def scan_order(name):
+    return name.split("/")
+
+
+class Command(BaseCommand):
+    help = "Delete media files no database row references, across every upload directory and the renditions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--grace-hours", type=float, default=24, help="Keep unreferenced files younger than this, uploads in flight may not be committed yet")
+        parser.add_argument("--dry-run", action="store_true", help="Report orphaned files without deleting them")
+        parser.add_argument("--resume", action="store_true", help="Continue after the last checkpoint of an interrupted run")
+        parser.add_argument("--workers", type=int, default=8, help="Threads deleting files")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Files deleted between checkpoints")
+        parser.add_argument("--checkpoint", default=os.path.join(settings.MEDIA_ROOT, ".gc_media_checkpoint"))
+
+    def handle(self, *args, **options):
+        root = settings.MEDIA_ROOT
+        dry_run = options["dry_run"]
+        cutoff = time.time() - options["grace_hours"] * 3600
+        checkpoint = options["checkpoint"]
+
+        resume_after = None
+        if options["resume"] and os.path.exists(checkpoint):
+            with open(checkpoint) as file:
+                resume_after = scan_order(file.read().strip())
+            self.stdout.write(f"Resuming after {'/'.join(resume_after)}")
+
+        referenced = referenced_names()
+        self.stdout.write(f"{len(referenced)} referenced files")
+
+        self.scanned = self.kept_young = self.deleted = self.freed = 0
+        orphaned = []
+        with ThreadPoolExecutor(max_workers=max(1, options["workers"])) as pool:
+            for directory in media_directories():
+                for name, entry in walk(root, directory):
+                    if resume_after is not None and scan_order(name) <= resume_after:
+                        continue
+                    self.scanned += 1
+                    if name in referenced:
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_mtime > cutoff:
+                        self.kept_young += 1
+                        continue
+
+                    orphaned.append((name, stat.st_size))
+                    if len(orphaned) >= options["batch_size"]:
+                        self.delete(pool, root, orphaned, dry_run, checkpoint, position=name)
+                        orphaned = []
+            self.delete(pool, root, orphaned, dry_run, checkpoint, position=None)
+
+        if not dry_run and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        action = "would delete" if dry_run else "deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {self.scanned} files, {action} {self.deleted} orphans ({self.freed / 2 ** 20:.1f} MiB), "
+            f"kept {self.kept_young} younger than the grace period"
+        ))
+
+    # Delete one batch in the thread pool, then record how far the scan got
+    def delete(self, pool, root, orphaned, dry_run, checkpoint, position):
+        if dry_run:
+            for name, size in orphaned:
+                self.stdout.write(name)
+            removed = [True] * len(orphaned)
+        else:
+            removed = pool.map(self.remove, (os.path.join(root, name) for name, _ in orphaned))
+
+        for (_, size), done in zip(orphaned, removed):
+            if done:
+                self.deleted += 1
+                self.freed += size
+
+        if not dry_run and position is not None:
+            with open(checkpoint, "w") as file:
+                file.write(position)
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        return True
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.images import POLL_SECONDS, WORKERS, run_worker
+
+
+class Command(BaseCommand):
+    help = "Run the image processing worker: compress post images and resize profile images queued on upload"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=WORKERS, help="Jobs processed at the same time")
+        parser.add_argument("--once", action="store_true", help="Exit once no job is due instead of polling for new ones")
+        parser.add_argument("--poll-interval", type=float, default=POLL_SECONDS)
+
+    def handle(self, *args, **options):
+        done, failed = run_worker(workers=max(1, options["workers"]), once=options["once"], poll_seconds=options["poll_interval"])
+        self.stdout.write(self.style.SUCCESS(f"Processed {done} images, {failed} failed attempts"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.trending import prune_buckets
+
+
+class Command(BaseCommand):
+    help = "Delete tag usage buckets older than the longest trending window"
+
+    def handle(self, *args, **options):
+        deleted = prune_buckets()
+        self.stdout.write(self.style.SUCCESS(f"Removed {deleted} tag usage buckets"))
@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
+
+from api.models import Comment, ImageBlob, Post, UserProfile
+
+
+# name -> (model, stored counter field, expression computing the true value)
+COUNTERS = {
+    "post_likes": (Post, "likes_count", lambda: Count("likes")),
+    "comment_likes": (Comment, "likes_count", lambda: Count("likes")),
+    "comment_replies": (Comment, "replies_count", lambda: count_descendants()),
+    "profile_followers": (UserProfile, "followers_count", lambda: count_follows("user_id", "user_id")),
+    "profile_following": (UserProfile, "following_count", lambda: count_follows("userprofile_id", "pk")),
+    "image_blobs": (ImageBlob, "ref_count", lambda: count_rows(Post, "image_blob") + count_rows(UserProfile, "profile_image_blob")),
+}
+
+
+def count_rows(model, column):
+    rows = (
+        model.objects.filter(**{column: OuterRef("pk")})
+        .order_by()
+        .values(column)
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def count_follows(column, outer_column):
+    follows = (
+        UserProfile.following.through.objects.filter(**{column: OuterRef(outer_column)})
+        .order_by()
+        .values(column)
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(follows, output_field=IntegerField()), 0)
+
+
+def count_descendants():
+    descendants = (
+        Comment.objects.filter(path__startswith=Concat(OuterRef("path"), Value("/")))
+        .order_by()
+        .values("post")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(descendants, output_field=IntegerField()), 0)
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized counters in primary key batches and fix the ones that drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument("counters", nargs="*", help=f"Counters to reconcile ({', '.join(sorted(COUNTERS))}), all by default")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true", help="Report drifted rows without fixing them")
+
+    def handle(self, *args, **options):
+        unknown = set(options["counters"]) - set(COUNTERS)
+        if unknown:
+            raise CommandError(f"Unknown counters: {', '.join(sorted(unknown))}")
+
+        for name in options["counters"] or sorted(COUNTERS):
+            model, field, expression = COUNTERS[name]
+            fixed = self.reconcile(model, field, expression, options["batch_size"], options["dry_run"])
+            self.stdout.write(self.style.SUCCESS(f"{name}: {fixed} drifted rows"))
+
+    def reconcile(self, model, field, expression, batch_size, dry_run):
+        fixed = 0
+        last_pk = 0
+        while True:
+            pks = list(model.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                return fixed
+            last_pk = pks[-1]
+
+            drifted = (
+                model.objects.filter(pk__in=pks)
+                .order_by()
+                .annotate(actual=expression())
+                .filter(~Q(**{field: F("actual")}))
+                .values_list("pk", "actual")
+            )
+            rows = [model(pk=pk, **{field: actual}) for pk, actual in drifted]
+            fixed += len(rows)
+            if rows and not dry_run:
+                model.objects.bulk_update(rows, [field])
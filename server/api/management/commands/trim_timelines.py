@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from api.models import TimelineEntry
+from api.timelines import TIMELINE_MAX_LENGTH, trim_timeline
+
+
+class Command(BaseCommand):
+    help = "Drop the oldest home timeline entries of every timeline longer than TIMELINE_MAX_LENGTH"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-length", type=int, default=TIMELINE_MAX_LENGTH)
+
+    def handle(self, *args, **options):
+        max_length = options["max_length"]
+        overfull = (
+            TimelineEntry.objects.order_by()
+            .values("user_id")
+            .annotate(entries=Count("id"))
+            .filter(entries__gt=max_length)
+            .values_list("user_id", flat=True)
+        )
+
+        trimmed = 0
+        for user_id in overfull.iterator():
+            trimmed += trim_timeline(user_id, max_length)
+
+        self.stdout.write(self.style.SUCCESS(f"Removed {trimmed} timeline entries"))
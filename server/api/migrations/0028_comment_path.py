@@ -0,0 +1,35 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+def build_comment_paths(apps, schema_editor):
+    Comment = apps.get_model("api", "Comment")
+    paths = {}
+    batch = []
+    # Parents always have a lower id than their replies, so they are seen first
+    for comment in Comment.objects.order_by("id").only("id", "parent_id").iterator():
+        segment = str(comment.id).zfill(10)
+        comment.path = paths[comment.parent_id] + "/" + segment if comment.parent_id else segment
+        paths[comment.id] = comment.path
+        batch.append(comment)
+        if len(batch) >= 1000:
+            Comment.objects.bulk_update(batch, ["path"])
+            batch = []
+    Comment.objects.bulk_update(batch, ["path"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_likes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(build_comment_paths, migrations.RunPython.noop),
+    ]
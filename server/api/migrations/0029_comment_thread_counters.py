@@ -0,0 +1,40 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+from collections import Counter
+
+
+def fill_thread_counters(apps, schema_editor):
+    Comment = apps.get_model("api", "Comment")
+    comments = list(Comment.objects.only("id", "path"))
+    replies = Counter()
+    for comment in comments:
+        for segment in comment.path.split("/")[:-1]:
+            replies[int(segment)] += 1
+
+    for comment in comments:
+        comment.top_level_parent_id = int(comment.path.split("/")[0])
+        comment.replies_count = replies[comment.id]
+    Comment.objects.bulk_update(comments, ["top_level_parent", "replies_count"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_comment_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='replies_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='top_level_parent',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thread_replies', to='api.comment'),
+        ),
+        migrations.RunPython(fill_thread_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0029_comment_thread_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'parent', '-pinned', '-likes_count', '-created_at', '-id'], name='comment_ranking_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+from django.utils.text import slugify
+
+
+# Tags are now stored lower case. The unique slug already kept names that only differ
+# by case from coexisting, so lower casing them in place cannot collide.
+def normalize_tag_names(apps, schema_editor):
+    Tag = apps.get_model("api", "Tag")
+    for tag in Tag.objects.order_by("id").iterator():
+        name = tag.name.lstrip("#").strip().lower()
+        slug = slugify(name, allow_unicode=True)
+        if (tag.name, tag.slug) != (name, slug):
+            Tag.objects.filter(pk=tag.pk).update(name=name, slug=slug)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0030_comment_ranking_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_tag_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0031_normalize_tag_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagUsageBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_buckets', to='api.tag')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tagusagebucket',
+            index=models.Index(fields=['bucket'], name='tag_usage_bucket_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='tagusagebucket',
+            constraint=models.UniqueConstraint(fields=('tag', 'bucket'), name='tag_usage_unique_bucket'),
+        ),
+    ]
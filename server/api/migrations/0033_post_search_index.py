@@ -0,0 +1,70 @@
+from django.db import migrations
+
+
+# External content FTS5 index over api_post, kept in step with the table by triggers so every
+# insert, update and delete (including cascades and bulk deletes) reaches the index. SQLite drops
+# the triggers whenever a later migration rebuilds api_post, search.restore_triggers puts them
+# back after every migrate.
+TABLE_SQL = [
+    """
+    CREATE VIRTUAL TABLE api_post_fts USING fts5(
+        title, description,
+        content='api_post', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    # Title matches weigh more than description matches
+    "INSERT INTO api_post_fts(api_post_fts, rank) VALUES('rank', 'bm25(10.0, 1.0)')",
+]
+
+TRIGGER_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS api_post_fts_insert AFTER INSERT ON api_post BEGIN
+        INSERT INTO api_post_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_post_fts_delete AFTER DELETE ON api_post BEGIN
+        INSERT INTO api_post_fts(api_post_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_post_fts_update AFTER UPDATE OF title, description ON api_post BEGIN
+        INSERT INTO api_post_fts(api_post_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO api_post_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+REBUILD_SQL = ["INSERT INTO api_post_fts(api_post_fts) VALUES('rebuild')"]
+
+CREATE_SQL = TABLE_SQL + TRIGGER_SQL + REBUILD_SQL
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS api_post_fts_update",
+    "DROP TRIGGER IF EXISTS api_post_fts_delete",
+    "DROP TRIGGER IF EXISTS api_post_fts_insert",
+    "DROP TABLE IF EXISTS api_post_fts",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # Full text search is only available on SQLite
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0032_tagusagebucket'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL)),
+    ]
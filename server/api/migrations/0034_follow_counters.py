@@ -0,0 +1,40 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:58
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_follows(apps, schema_editor):
+    UserProfile = apps.get_model("api", "UserProfile")
+    follows = UserProfile.following.through.objects.order_by()
+
+    def total(column, outer_column):
+        rows = follows.filter(**{column: OuterRef(outer_column)}).values(column).annotate(total=Count("pk")).values("total")
+        return Coalesce(Subquery(rows), 0)
+
+    UserProfile.objects.update(
+        followers_count=total("user_id", "user_id"),
+        following_count=total("userprofile_id", "pk"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0033_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_existing_follows, migrations.RunPython.noop),
+    ]
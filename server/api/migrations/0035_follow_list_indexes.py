@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+# The auto created UserProfile.following through table can't declare Meta.indexes, so the
+# composite indexes behind the paginated followers / following lists are created here.
+# Each one serves "rows of one user, newest follow first" as a single range.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0034_follow_counters'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX api_userprofile_following_followers_idx ON api_userprofile_following (user_id, id)",
+            "DROP INDEX api_userprofile_following_followers_idx",
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX api_userprofile_following_following_idx ON api_userprofile_following (userprofile_id, id)",
+            "DROP INDEX api_userprofile_following_following_idx",
+        ),
+    ]
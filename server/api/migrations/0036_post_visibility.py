@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0035_follow_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='visibility',
+            field=models.CharField(choices=[('public', 'Public'), ('close_friends', 'Close friends')], default='public', max_length=20),
+        ),
+    ]
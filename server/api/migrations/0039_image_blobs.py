@@ -0,0 +1,85 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:08
+
+import hashlib
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Queued jobs pointed at posts and profiles, they now point at blobs. Every image with work
+# still queued gets a blob for its current file, older processed images stay without one.
+def move_jobs_to_blobs(apps, schema_editor):
+    ImageJob = apps.get_model("api", "ImageJob")
+    ImageBlob = apps.get_model("api", "ImageBlob")
+    owners = {
+        "post_image": (apps.get_model("api", "Post"), "image"),
+        "profile_image": (apps.get_model("api", "UserProfile"), "profile_image"),
+    }
+
+    for job in ImageJob.objects.all():
+        model, field = owners[job.kind]
+        owner = model.objects.filter(pk=job.object_id).first()
+        name = getattr(owner, field).name if owner else None
+        if not name or not default_storage.exists(name):
+            if owner is not None and job.kind == "post_image":
+                owner.image_status = "failed"
+                owner.save(update_fields=["image_status"])
+            job.delete()
+            continue
+
+        digest = hashlib.sha256()
+        with default_storage.open(name) as file:
+            for chunk in file.chunks():
+                digest.update(chunk)
+        blob, created = ImageBlob.objects.get_or_create(kind=job.kind, sha256=digest.hexdigest(), defaults={"name": name})
+        blob.ref_count += 1
+        blob.save(update_fields=["ref_count"])
+        # The duplicate file is left behind as an orphan
+        setattr(owner, field, blob.name)
+        setattr(owner, f"{field}_blob", blob)
+        owner.save(update_fields=[field, f"{field}_blob"])
+
+        if created:
+            job.object_id = blob.pk
+            job.save(update_fields=["object_id"])
+        else:
+            job.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0038_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post_image', 'Post image'), ('profile_image', 'Profile image')], max_length=20)),
+                ('sha256', models.CharField(max_length=64)),
+                ('name', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('renditions', models.JSONField(blank=True, default=list)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='imageblob',
+            constraint=models.UniqueConstraint(fields=('kind', 'sha256'), name='image_blob_unique_content'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='posts', to='api.imageblob'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='profile_image_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='profiles', to='api.imageblob'),
+        ),
+        migrations.RunPython(move_jobs_to_blobs, migrations.RunPython.noop),
+    ]
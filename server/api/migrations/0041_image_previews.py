@@ -0,0 +1,119 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:13
+
+import base64
+import io
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+from PIL import Image, ImageOps
+
+
+# Frozen copies of images.open_image and images.make_preview as of this migration
+def open_image(file):
+    with Image.open(file) as image:
+        image.load()
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        return image
+
+
+def make_preview(image):
+    height = max(1, round(image.height * 20 / image.width))
+    tiny = image.resize((20, height), resample=Image.BOX)
+    buffer = io.BytesIO()
+    tiny.save(buffer, "WEBP", quality=30)
+    placeholder = "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+    palette = tiny.convert("RGB").quantize(colors=8)
+    _, index = max(palette.getcolors())
+    red, green, blue = palette.getpalette()[index * 3:index * 3 + 3]
+    return placeholder, f"#{red:02x}{green:02x}{blue:02x}"
+
+
+# Blobs already processed get the size of their stored image, which is small by now, and a
+# preview, copied onto the posts and profiles using them. Pending blobs get theirs from the job,
+# images older than the blob table from `manage.py backfill_image_blobs`.
+def fill_previews(apps, schema_editor):
+    ImageBlob = apps.get_model("api", "ImageBlob")
+    users = {
+        "post_image": (apps.get_model("api", "Post"), "image_blob", "image_"),
+        "profile_image": (apps.get_model("api", "UserProfile"), "profile_image_blob", "profile_image_"),
+    }
+
+    for blob in ImageBlob.objects.filter(status="ready").iterator(chunk_size=500):
+        try:
+            with default_storage.open(blob.name) as file:
+                image = open_image(file)
+        except OSError:
+            continue
+        blob.width, blob.height = image.size
+        blob.placeholder, blob.dominant_color = make_preview(image)
+        blob.save(update_fields=["width", "height", "placeholder", "dominant_color"])
+
+        model, field, prefix = users[blob.kind]
+        model.objects.filter(**{field: blob}).update(**{
+            f"{prefix}{name}": getattr(blob, name) for name in ("width", "height", "placeholder", "dominant_color")
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0040_image_blob_header'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageblob',
+            name='dominant_color',
+            field=models.CharField(blank=True, default='', max_length=7),
+        ),
+        migrations.AddField(
+            model_name='imageblob',
+            name='placeholder',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_dominant_color',
+            field=models.CharField(blank=True, default='', max_length=7),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_placeholder',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='profile_image_dominant_color',
+            field=models.CharField(blank=True, default='', max_length=7),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='profile_image_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='profile_image_placeholder',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='profile_image_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_previews, migrations.RunPython.noop),
+    ]
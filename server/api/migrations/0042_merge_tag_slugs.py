@@ -0,0 +1,49 @@
+from django.db import migrations
+from django.db.models import F
+from django.utils.text import slugify
+
+
+# Tags are now looked up by slug. Legacy slugs are recomputed the way Tag.make_slug does, tags
+# left with an empty slug are deleted, and tags sharing a slug are merged into the oldest one:
+# their posts and usage buckets move over, the others are deleted.
+def merge_tag_slugs(apps, schema_editor):
+    Tag = apps.get_model("api", "Tag")
+    TagUsageBucket = apps.get_model("api", "TagUsageBucket")
+    post_tags = apps.get_model("api", "Post").tags.through.objects
+
+    by_slug = {}
+    for tag in Tag.objects.order_by("id").iterator():
+        slug = slugify(tag.name.lstrip("#").strip().lower(), allow_unicode=True)
+        if not slug:
+            tag.delete()
+            continue
+        keep = by_slug.setdefault(slug, tag)
+        if keep.pk == tag.pk:
+            continue
+
+        post_tags.filter(tag_id=tag.pk).exclude(
+            post_id__in=post_tags.filter(tag_id=keep.pk).values("post_id")
+        ).update(tag_id=keep.pk)
+        for bucket in TagUsageBucket.objects.filter(tag_id=tag.pk):
+            merged, created = TagUsageBucket.objects.get_or_create(tag_id=keep.pk, bucket=bucket.bucket, defaults={"count": bucket.count})
+            if not created:
+                TagUsageBucket.objects.filter(pk=merged.pk).update(count=F("count") + bucket.count)
+        tag.delete()
+
+    # Through a placeholder first, a tag may take a slug another one is moving away from
+    changed = [(tag, slug) for slug, tag in by_slug.items() if tag.slug != slug]
+    for tag, _ in changed:
+        Tag.objects.filter(pk=tag.pk).update(slug=f"~{tag.pk}")
+    for tag, slug in changed:
+        Tag.objects.filter(pk=tag.pk).update(slug=slug)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0041_image_previews'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_tag_slugs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0042_merge_tag_slugs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='path',
+            field=models.TextField(db_index=True, default='', editable=False),
+        ),
+    ]
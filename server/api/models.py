@@ -1,12 +1,14 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
 from django.utils.text import slugify
 from django.contrib.auth.models import User
 import os 
+import re
 from uuid import uuid4
-from PIL import Image
 
 from django.utils.deconstruct import deconstructible
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 
 # make the path for the new file and rename it with uuid
@@ -20,18 +22,105 @@ class PathAndRename:
         filename = f"{uuid4().hex}.{ext}"
         return os.path.join(self.path, filename)
 
+# Hashtags are word characters after a "#", stored lower case: "#Sunset!" -> "sunset"
+TAG_PATTERN = re.compile(r"#(\w+)")
+
+
+def normalize_tag(name):
+    return name.lstrip("#").strip().lower()
+
+
+def extract_tags(text):
+    """
+    {slug: name} of the tags in `text` in order of first appearance. Tags are identified by
+    their slug, "#sunset_" and "#ｓｕｎｓｅｔ" are both "sunset", and a tag with no slug ("#_") is dropped.
+    """
+    tags = {}
+    for match in TAG_PATTERN.findall(text or ""):
+        name = normalize_tag(match)
+        slug = Tag.make_slug(name)
+        if slug:
+            tags.setdefault(slug, name)
+    return tags
+
+
 class Tag(models.Model):
     name = models.CharField(max_length=255, unique=True)
     slug= models.SlugField(max_length=255, unique=True)
 
+    @staticmethod
+    def make_slug(name):
+        return slugify(name, allow_unicode=True)
+
     def save(self,*args, **kwargs):
-        self.slug = slugify(self.name)
+        self.slug = self.make_slug(self.name)
         return super().save(*args, **kwargs)
     
     def __str__(self):
         return self.name
 
 
+# Tag usage counted per time bucket, trending lists are summed from these (see trending.py)
+class TagUsageBucket(models.Model):
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name="usage_buckets")
+    bucket = models.DateTimeField()
+    # Can go below zero in a bucket where a tag was removed from an older post
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.tag_id} @ {self.bucket}: {self.count}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tag", "bucket"], name="tag_usage_unique_bucket"),
+        ]
+        indexes = [
+            models.Index(fields=["bucket"], name="tag_usage_bucket_idx"),
+        ]
+
+
+# Post audience: everyone, or only the author's close friends
+VISIBILITY_PUBLIC = "public"
+VISIBILITY_CLOSE_FRIENDS = "close_friends"
+VISIBILITY_CHOICES = [
+    (VISIBILITY_PUBLIC, "Public"),
+    (VISIBILITY_CLOSE_FRIENDS, "Close friends"),
+]
+
+
+def post_visibility_filter(user_id, prefix=""):
+    """
+    Q for the posts user `user_id` may see: public ones, their own, and the close friends posts
+    of authors that listed them as a close friend. Those authors come from one subquery on the
+    close friends table's user index, so the filter stays in SQL whatever the page size.
+    `prefix` points the filter at a related post, e.g. "post__".
+    """
+    audience_of = UserProfile.close_friends.through.objects.filter(user_id=user_id).values("userprofile__user_id")
+    return (
+        Q(**{f"{prefix}visibility": VISIBILITY_PUBLIC})
+        | Q(**{f"{prefix}user_id": user_id})
+        | Q(**{f"{prefix}user_id__in": audience_of})
+    )
+
+
+class PostQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        return self.filter(post_visibility_filter(user.id))
+
+
+# Where an uploaded image is in the background processing pipeline (see images.py)
+IMAGE_PENDING = "pending"
+IMAGE_PROCESSING = "processing"
+IMAGE_READY = "ready"
+IMAGE_FAILED = "failed"
+IMAGE_STATUS_CHOICES = [
+    (IMAGE_PENDING, "Pending"),
+    (IMAGE_PROCESSING, "Processing"),
+    (IMAGE_READY, "Ready"),
+    (IMAGE_FAILED, "Failed"),
+]
+
+
 #  Post Model
 class Post(models.Model):
     title= models.CharField(max_length=100, blank=True, null=True)
@@ -39,69 +128,105 @@ class Post(models.Model):
     image  = models.ImageField(upload_to=PathAndRename("post_images"), blank=True, null=True)
     user = models.ForeignKey(User, blank=True, null=True,  on_delete=models.CASCADE, related_name='posts')
     likes = models.ManyToManyField(User, blank=True, related_name="liked_posts",  related_query_name='liked_post')
+    # Denormalized likes.count(), kept in step by likes.py
+    likes_count = models.PositiveIntegerField(default=0)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
     tags = models.ManyToManyField(Tag, blank=True)
+    visibility = models.CharField(max_length=20, choices=VISIBILITY_CHOICES, default=VISIBILITY_PUBLIC)
+    # The uploaded file is served as is until its job has compressed it
+    image_status = models.CharField(max_length=20, choices=IMAGE_STATUS_CHOICES, default=IMAGE_READY)
+    # [{"name", "width", "height", "size"}] smallest first, one per IMAGE_RENDITION_WIDTHS below the upload's width
+    image_renditions = models.JSONField(default=list, blank=True)
+    # Size of the stored image and a preview to show until it loads, copied from image_blob
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    image_placeholder = models.TextField(blank=True, default="")
+    image_dominant_color = models.CharField(max_length=7, blank=True, default="")
+    # Stored upload shared with every other post of the same bytes, null for images older than the blob table
+    image_blob = models.ForeignKey("ImageBlob", null=True, blank=True, on_delete=models.SET_NULL, related_name="posts")
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self): 
         return self.title
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        post = super().from_db(db, field_names, values)
+        if "visibility" in field_names:
+            post._saved_visibility = values[field_names.index("visibility")]
+        return post
+
     def save(self, *args, **kwargs):
         is_new_post = not self.pk  # Check if it's a new post
 
-        super().save(*args, **kwargs)  # Save the instance to generate an ID
-
-        if is_new_post:  # If it's a new post, update the tags
-            self._parse_and_update_tags()
-        else:  # If it's an existing post, update the tags on update
-            self._update_tags_on_update()
-
-        if self.image and is_new_post:  # If it's a new post and image is present
-            self._compress_image_as_webp()
-
-
-    def _parse_and_update_tags(self):
+        # Only public posts count towards trending and autocomplete, so the audience before the save matters
+        was_public = False
+        if not is_new_post:
+            if hasattr(self, "_saved_visibility"):
+                was_public = self._saved_visibility == VISIBILITY_PUBLIC
+            else:
+                was_public = Post.objects.filter(pk=self.pk, visibility=VISIBILITY_PUBLIC).exists()
+
+        with transaction.atomic():
+            # A new upload is stored by content hash and processed by a worker, `manage.py process_images`
+            from . import images
+            changed = images.sync_upload(self, ImageJob.POST_IMAGE)
+            if changed and kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], *changed}
+            super().save(*args, **kwargs)  # Save the instance to generate an ID
+
+        added_tags, removed_tags = self._sync_tags(is_new_post, was_public)
+        self._saved_visibility = self.visibility
+        if added_tags or removed_tags:
+            from . import autocomplete
+            from .trending import record_tag_usage
+            transaction.on_commit(lambda: record_tag_usage(added_tags, removed_tags))
+            transaction.on_commit(lambda: autocomplete.tags_changed(added_tags, removed_tags))
+
+        if is_new_post:
+            # Push the post into the followers' home timelines once it is committed
+            from .timelines import fanout_post
+            transaction.on_commit(lambda: fanout_post(self))
+
+
+    # Set based tag sync: one insert-ignore for unknown tags and one diff against the post's tag rows,
+    # whatever the number of hashtags. Tags are matched by slug, an existing tag spelled differently
+    # ("sunset!" for "#sunset") is reused. Returns the ids of the tags this post now counts towards
+    # and stopped counting towards, which only public posts do.
+    def _sync_tags(self, is_new_post, was_public):
         tags = self._extract_tags_from_description()
-        self.tags.clear()  # Remove existing tags
-        for tag_name in tags:
-            tag, _ = Tag.objects.get_or_create(name=tag_name)
-            self.tags.add(tag)
+        tag_ids = set()
+        if tags:
+            Tag.objects.bulk_create([Tag(name=name, slug=slug) for slug, name in tags.items()], ignore_conflicts=True)
+            tag_ids = set(Tag.objects.filter(slug__in=tags).values_list("id", flat=True))
 
-    def _update_tags_on_update(self):
-        existing_tags = set(self.tags.values_list('name', flat=True))
-        new_tags = set(self._extract_tags_from_description())
+        post_tags = Post.tags.through.objects
+        current = set() if is_new_post else set(post_tags.filter(post_id=self.pk).values_list("tag_id", flat=True))
 
-        tags_to_remove = existing_tags - new_tags
-        tags_to_add = new_tags - existing_tags
+        removed = current - tag_ids
+        if removed:
+            post_tags.filter(post_id=self.pk, tag_id__in=removed).delete()
 
-        # Remove tags that are no longer present in the description
-        for tag_name in tags_to_remove:
-            tag = Tag.objects.get(name=tag_name)
-            self.tags.remove(tag)
+        added = tag_ids - current
+        if added:
+            post_tags.bulk_create([Post.tags.through(post_id=self.pk, tag_id=tag_id) for tag_id in added], ignore_conflicts=True)
 
-        # Add new tags found in the updated description
-        for tag_name in tags_to_add:
-            tag, _ = Tag.objects.get_or_create(name=tag_name)
-            self.tags.add(tag)
+        counted_before = current if was_public else set()
+        counted_now = tag_ids if self.visibility == VISIBILITY_PUBLIC else set()
+        return counted_now - counted_before, counted_before - counted_now
 
     def _extract_tags_from_description(self):
-        return [tag.strip('#') for tag in self.description.split() if tag.startswith('#')]
-
-    def _compress_image_as_webp(self):
-        # Open the uploaded image using PIL
-        image = Image.open(self.image.path)
-
-        # Set the maximum dimension for resizing the image
-        max_dimension = 500
+        return extract_tags(self.description)
 
-        # Resize the image if it exceeds the maximum dimension
-        if image.width > max_dimension or image.height > max_dimension:
-            image.thumbnail((max_dimension, max_dimension), resample=Image.BICUBIC)
-
-        # Convert the image to WebP format with compression
-        image.save(self.image.path, "WEBP", method=6, quality=90)
     class Meta: 
-        ordering =  ["-created"]
+        # id breaks ties between posts created in the same instant, the feed cursor relies on it
+        ordering =  ["-created", "-id"]
+        indexes = [
+            models.Index(fields=["-created", "-id"], name="post_created_id_idx"),
+            models.Index(fields=["user", "-created", "-id"], name="post_user_created_idx"),
+        ]
         verbose_name = 'Post'
         verbose_name_plural = 'Posts'
 
@@ -157,23 +282,53 @@ class UserProfile(models.Model):
         blank=True,
         null=True
     )
+    # Denormalized follow counts, kept in step by follows.py
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    # Set when the account has too many followers to fan out on write, followers then pull its posts on read
+    fanout_on_read = models.BooleanField(default=False, db_index=True)
+    # Same shape as Post.image_renditions, for IMAGE_PROFILE_RENDITION_WIDTHS
+    profile_image_renditions = models.JSONField(default=list, blank=True)
+    profile_image_width = models.PositiveIntegerField(null=True, blank=True)
+    profile_image_height = models.PositiveIntegerField(null=True, blank=True)
+    profile_image_placeholder = models.TextField(blank=True, default="")
+    profile_image_dominant_color = models.CharField(max_length=7, blank=True, default="")
+    profile_image_blob = models.ForeignKey("ImageBlob", null=True, blank=True, on_delete=models.SET_NULL, related_name="profiles")
 
     def __str__(self):
         return self.user.username
 
     def get_followers_count(self):
-        return self.followers.count()
+        return self.followers_count
 
     def get_following_count(self):
-        return self.following.count()
+        return self.following_count
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        profile = super().from_db(db, field_names, values)
+        profile._saved_values = dict(zip(field_names, values))
+        return profile
+
+    # Fields changed in memory since the profile was loaded or saved, None if it never was
+    def changed_fields(self):
+        saved = getattr(self, "_saved_values", None)
+        if saved is None:
+            return None
+        return [
+            field.attname for field in self._meta.concrete_fields
+            if field.attname in saved and getattr(self, field.attname) != saved[field.attname]
+        ]
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        if self.profile_image:
-            with Image.open(self.profile_image.path) as img:
-                if img.width > 500 or img.height > 500:
-                    img.thumbnail((500, 500), resample=Image.BICUBIC)
-                    img.save(self.profile_image.path, optimize=True, quality=85)
+        with transaction.atomic():
+            # A new upload is stored by content hash and resized by a worker, `manage.py process_images`
+            from . import images
+            changed = images.sync_upload(self, ImageJob.PROFILE_IMAGE)
+            if changed and kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], *changed}
+            super().save(*args, **kwargs)
+        self._saved_values = {field.attname: field.value_from_object(self) for field in self._meta.concrete_fields}
 
 
     class Meta:
@@ -187,9 +342,31 @@ def create_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.create(user=instance)
 
 
+# Saves a profile changed in memory through its user (user.userprofile.bio = ...; user.save()).
+# A profile that was not loaded, or has no changes, is left alone, so logins and token
+# refreshes saving the user don't write the profile.
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    instance.userprofile.save()
+    if not User.userprofile.is_cached(instance):
+        return
+    profile = instance.userprofile
+    changed = profile.changed_fields()
+    if changed is None:
+        profile.save()
+    elif changed:
+        profile.save(update_fields=changed)
+
+
+@receiver(post_save, sender=User)
+def index_username(sender, instance, **kwargs):
+    from . import autocomplete
+    autocomplete.user_saved(instance)
+
+
+@receiver(post_delete, sender=User)
+def unindex_username(sender, instance, **kwargs):
+    from . import autocomplete
+    autocomplete.user_deleted(instance.pk)
 
 class SavedPost(models.Model):
     user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE,  )
@@ -200,6 +377,182 @@ class SavedPost(models.Model):
 
 
 
+# Home timeline, materialized per reader on post creation (see timelines.py)
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline_entries")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries")
+    # Copy of post.created so a page of the feed is a single (user, created, post) range read
+    created = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user_id} <- {self.post_id}"
+
+    class Meta:
+        ordering = ["-created", "-post"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "post"], name="timeline_unique_user_post"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-created", "-post"], name="timeline_user_created_idx"),
+        ]
+
+
+# Database backed queue of image processing work on ImageBlob rows, drained by `manage.py process_images` (see images.py)
+class ImageJob(models.Model):
+    POST_IMAGE = "post_image"
+    PROFILE_IMAGE = "profile_image"
+    KIND_CHOICES = [
+        (POST_IMAGE, "Post image"),
+        (PROFILE_IMAGE, "Profile image"),
+    ]
+
+    PENDING = "pending"
+    RUNNING = "running"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (FAILED, "Failed"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Not picked up before this, pushed back after every failed attempt
+    available_at = models.DateTimeField(default=timezone.now)
+    # Claim of the worker running the job, a claim older than IMAGE_JOB_LOCK_SECONDS is considered dead
+    locked_by = models.CharField(max_length=32, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} ({self.status})"
+
+    # Pending work for a blob is queued once
+    @classmethod
+    def enqueue(cls, kind, object_id):
+        if not cls.objects.filter(kind=kind, object_id=object_id, status=cls.PENDING).exists():
+            cls.objects.create(kind=kind, object_id=object_id)
+
+    class Meta:
+        ordering = ["available_at", "id"]
+        indexes = [
+            models.Index(fields=["status", "available_at"], name="image_job_status_idx"),
+            models.Index(fields=["kind", "object_id"], name="image_job_object_idx"),
+        ]
+
+
+# One stored upload, shared by every post or profile that uploaded the same bytes (see images.py).
+# The file and its renditions are deleted when the last reference goes.
+class ImageBlob(models.Model):
+    kind = models.CharField(max_length=20, choices=ImageJob.KIND_CHOICES)
+    sha256 = models.CharField(max_length=64)
+    # Storage name of the processed image, the renditions are listed in `renditions`
+    name = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=IMAGE_STATUS_CHOICES, default=IMAGE_PENDING)
+    renditions = models.JSONField(default=list, blank=True)
+    # Of the stored image as displayed: read from the upload's header, so deciding what to do with
+    # it needs no decode, then replaced by the processed size
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    format = models.CharField(max_length=10, blank=True, default="")
+    # Tiny WebP data uri and "#rrggbb", made in the same pass as the renditions
+    placeholder = models.TextField(blank=True, default="")
+    dominant_color = models.CharField(max_length=7, blank=True, default="")
+    # Posts or profiles pointing at the blob, kept in step by images.py
+    ref_count = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "sha256"], name="image_blob_unique_content"),
+        ]
+
+
+# A deleted public post stops counting towards trending and autocomplete. Its tag rows are read
+# before the delete cascades to them.
+@receiver(pre_delete, sender=Post)
+def release_post_tags(sender, instance, **kwargs):
+    if getattr(instance, "_saved_visibility", instance.visibility) != VISIBILITY_PUBLIC:
+        return
+    tag_ids = list(Post.tags.through.objects.filter(post_id=instance.pk).values_list("tag_id", flat=True))
+    if not tag_ids:
+        return
+
+    from . import autocomplete
+    from .trending import record_tag_usage
+    # Taken off the buckets the post was counted in
+    transaction.on_commit(lambda: record_tag_usage((), tag_ids, moment=instance.created))
+    transaction.on_commit(lambda: autocomplete.tags_changed((), tag_ids))
+
+
+@receiver(post_delete, sender=Post)
+def release_post_image(sender, instance, **kwargs):
+    if instance.image_blob_id:
+        from . import images
+        images.release_blob(instance.image_blob_id)
+
+
+@receiver(post_delete, sender=UserProfile)
+def release_profile_image(sender, instance, **kwargs):
+    if instance.profile_image_blob_id:
+        from . import images
+        images.release_blob(instance.profile_image_blob_id)
+
+
+# Follows made through the ORM relation (admin, shell) get the same bookkeeping as the ones made by follows.py
+@receiver(m2m_changed, sender=UserProfile.following.through)
+def sync_follow_side_effects(sender, instance, action, reverse, pk_set, **kwargs):
+    from . import follows
+
+    # Normalize to (follower user id, followed user id) pairs whichever side the change was made from
+    if action in ("pre_clear", "pre_remove"):
+        # remove() names every id it was given in pk_set, followed or not, so only the rows
+        # about to be deleted are counted
+        rows = sender.objects.filter(user_id=instance.pk) if reverse else sender.objects.filter(userprofile_id=instance.pk)
+        if action == "pre_remove":
+            rows = rows.filter(userprofile_id__in=pk_set) if reverse else rows.filter(user_id__in=pk_set)
+        follows.record_follows(list(rows.values_list("userprofile__user_id", "user_id")), -1)
+        return
+    if action != "post_add":
+        return
+
+    # add() leaves the ids that were already followed out of pk_set
+    if reverse:
+        follower_ids = UserProfile.objects.filter(pk__in=pk_set).values_list("user_id", flat=True)
+        pairs = [(follower_id, instance.pk) for follower_id in follower_ids]
+    else:
+        pairs = [(instance.user_id, followed_id) for followed_id in pk_set]
+    follows.record_follows(pairs, 1)
+
+
+# Materialized path of a comment: the zero padded ids of its ancestors and itself joined by "/",
+# e.g. "0000000012/0000000034". Sorting by path gives a thread in display order (depth first,
+# oldest reply first) and a subtree is the index range between "<path>/" and "<path>0".
+# Threads have no depth limit, so the path is a TextField.
+COMMENT_PATH_SEPARATOR = "/"
+COMMENT_PATH_STEP = 10
+
+
+def comment_path_segment(pk):
+    return str(pk).zfill(COMMENT_PATH_STEP)
+
+
+# Order of the top level comments of a post, backed by comment_ranking_idx
+COMMENT_RANKING = ("-pinned", "-likes_count", "-created_at", "-id")
+
+
+class CommentQuerySet(models.QuerySet):
+    # Comments on the posts `user` may see
+    def visible_to(self, user):
+        return self.filter(post_visibility_filter(user.id, prefix="post__"))
+
+
 # Comment Model
 class Comment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -210,9 +563,64 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     likes = models.ManyToManyField(User, blank=True, related_name="liked_post_comment",  related_query_name='liked_post_comment')
+    # Denormalized likes.count(), kept in step by likes.py
+    likes_count = models.PositiveIntegerField(default=0)
     pinned = models.BooleanField(default=False)
+    path = models.TextField(db_index=True, editable=False, default="")
+    # Root of the thread, the comment itself for top level comments
+    top_level_parent = models.ForeignKey('self', null=True, blank=True, editable=False, on_delete=models.CASCADE, related_name='thread_replies')
+    # Number of replies below this comment at any depth
+    replies_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CommentQuerySet.as_manager()
     
     def __str__(self):
         return f"{self.content[:20]}... ({self.user.username})" 
+
+    def save(self, *args, **kwargs):
+        is_new_comment = not self.pk
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            # The path needs our own id, so it is written right after the insert
+            if is_new_comment:
+                segment = comment_path_segment(self.pk)
+                if self.parent_id:
+                    parent_path = Comment.objects.filter(pk=self.parent_id).values_list("path", flat=True).get()
+                    self.path = parent_path + COMMENT_PATH_SEPARATOR + segment
+                else:
+                    self.path = segment
+                self.top_level_parent_id = self.ancestor_ids()[0] if self.parent_id else self.pk
+                Comment.objects.filter(pk=self.pk).update(path=self.path, top_level_parent=self.top_level_parent_id)
+                Comment.objects.filter(pk__in=self.ancestor_ids()).update(replies_count=F("replies_count") + 1)
+
+    def ancestor_ids(self):
+        return [int(segment) for segment in self.path.split(COMMENT_PATH_SEPARATOR)[:-1]]
+
+    # All replies below this comment at any depth, in one index range
+    def descendants(self):
+        return Comment.objects.filter(
+            path__gt=self.path + COMMENT_PATH_SEPARATOR,
+            path__lt=self.path + chr(ord(COMMENT_PATH_SEPARATOR) + 1),
+        )
+
     class Meta:
         ordering =  ["-pinned", "-created_at"]
+        indexes = [
+            models.Index(fields=["post", "parent", *COMMENT_RANKING], name="comment_ranking_idx"),
+        ]
+
+
+# Ancestors lose the replies deleted below them however the delete started: on the comment, on a
+# queryset, or by cascade from a user (Comment.user, Comment.reply_to)
+@receiver(pre_delete, sender=Comment)
+def release_comment_replies(sender, instance, origin=None, **kwargs):
+    ancestor_ids = instance.ancestor_ids()
+    if not ancestor_ids:
+        return
+    if isinstance(origin, Post) and origin.pk == instance.post_id:
+        return  # the whole thread goes
+    if isinstance(origin, Comment) and origin.pk in ancestor_ids:
+        return  # counted by `origin` for its whole subtree
+    removed = 1 + instance.replies_count if isinstance(origin, Comment) and origin.pk == instance.pk else 1
+    Comment.objects.filter(pk__in=ancestor_ids, replies_count__gte=removed).update(replies_count=F("replies_count") - removed)
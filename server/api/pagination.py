@@ -0,0 +1,113 @@
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+# Cursors are the ordering values of the last row on the page, serialized to an
+# opaque url safe string. Clients should never build or inspect them.
+def encode_cursor(values):
+    raw = json.dumps([_dump(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+    if not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values
+
+
+# Decode a cursor and convert its values back to python for the model's ordering columns
+def decode_keyset_cursor(cursor, model, ordering):
+    values = decode_cursor(cursor)
+    if len(values) != len(ordering):
+        raise InvalidCursor(cursor)
+    return [_load(model, field, value) for field, value in zip(ordering, values)]
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        limit = int(request.query_params.get("limit", default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, maximum))
+
+
+def keyset_filter(ordering, values):
+    # Rows that come strictly after `values` in `ordering`, e.g. for ("-created", "-id"):
+    # created < c OR (created = c AND id < i)
+    after = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        after |= equal & Q(**{f"{name}__{lookup}": value})
+        equal &= Q(**{name: value})
+    return after
+
+
+def paginate_keyset(queryset, request, ordering, page_size=None):
+    """
+    Slice one page out of `queryset` using the ordering columns as the key instead
+    of OFFSET, so every page is a single index range read no matter how deep it is.
+    `ordering` must end in a unique column. Returns (rows, next_cursor).
+    """
+    size = page_size or get_page_size(request)
+    queryset = queryset.order_by(*ordering)
+
+    cursor = request.query_params.get("cursor")
+    if cursor:
+        values = decode_keyset_cursor(cursor, queryset.model, ordering)
+        queryset = queryset.filter(keyset_filter(ordering, values))
+
+    rows = list(queryset[:size + 1])
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor([_value_of(rows[-1], field) for field in ordering])
+    return rows, next_cursor
+
+
+def _value_of(row, field):
+    value = row
+    for attr in field.lstrip("-").split("__"):
+        value = getattr(value, attr)
+    return value
+
+
+def _dump(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def _load(model, field, value):
+    # Every ordering column is non null, and _dump only writes strings, numbers and booleans
+    if not isinstance(value, (str, int, float)):
+        raise InvalidCursor(value)
+    name = field.lstrip("-")
+    if "__" in name:
+        return value
+    try:
+        model_field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return value
+    try:
+        return model_field.to_python(value)
+    except (ValidationError, TypeError, ValueError):
+        raise InvalidCursor(value)
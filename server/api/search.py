@@ -0,0 +1,113 @@
+import re
+
+from django.db import connection, connections
+
+from .models import VISIBILITY_PUBLIC, Post
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+
+
+WORD_PATTERN = re.compile(r"\w+")
+MAX_QUERY_TERMS = 10
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+# The triggers keeping api_post_fts in step with api_post, as created by migration 0033
+TRIGGER_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS api_post_fts_insert AFTER INSERT ON api_post BEGIN
+        INSERT INTO api_post_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_post_fts_delete AFTER DELETE ON api_post BEGIN
+        INSERT INTO api_post_fts(api_post_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_post_fts_update AFTER UPDATE OF title, description ON api_post BEGIN
+        INSERT INTO api_post_fts(api_post_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO api_post_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+TRIGGER_NAMES = ["api_post_fts_insert", "api_post_fts_delete", "api_post_fts_update"]
+
+
+def restore_triggers(using="default", **kwargs):
+    """
+    post_migrate handler. SQLite drops the triggers whenever a migration rebuilds api_post, so
+    they are created again after every migrate, and the index is rebuilt if any were missing
+    since rows may have changed without them.
+    """
+    db = connections[using]
+    if db.vendor != "sqlite":
+        return
+    with db.cursor() as cursor:
+        cursor.execute("SELECT name, type FROM sqlite_master WHERE name = 'api_post_fts' OR type = 'trigger'")
+        existing = {name for name, _ in cursor.fetchall()}
+        if "api_post_fts" not in existing or existing.issuperset(TRIGGER_NAMES):
+            return
+        for statement in TRIGGER_SQL:
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO api_post_fts(api_post_fts) VALUES('rebuild')")
+
+
+# Free text -> FTS5 query: every word quoted so user input can't inject FTS syntax,
+# and the last word matched as a prefix so results show up while typing
+def build_match_query(text):
+    words = WORD_PATTERN.findall(text or "")[:MAX_QUERY_TERMS]
+    if not words:
+        return None
+    terms = ['"%s"' % word for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_posts(text, cursor, size, viewer):
+    """
+    Posts matching `text` in title or description that `viewer` may see, best bm25 rank first.
+    Pages are cut on (rank, id) so deep pages cost the same as the first one.
+    Returns (posts, next_cursor).
+    """
+    if connection.vendor != "sqlite":
+        raise SearchUnavailable()
+
+    match = build_match_query(text)
+    if match is None:
+        return [], None
+
+    # Same audience rule as Post.objects.visible_to, applied before the page is cut
+    sql = (
+        "SELECT api_post_fts.rowid, api_post_fts.rank FROM api_post_fts"
+        " JOIN api_post ON api_post.id = api_post_fts.rowid"
+        " WHERE api_post_fts MATCH %s AND (api_post.visibility = %s OR api_post.user_id = %s OR api_post.user_id IN ("
+        "SELECT api_userprofile.user_id FROM api_userprofile_close_friends"
+        " JOIN api_userprofile ON api_userprofile.id = api_userprofile_close_friends.userprofile_id"
+        " WHERE api_userprofile_close_friends.user_id = %s))"
+    )
+    params = [match, VISIBILITY_PUBLIC, viewer.id, viewer.id]
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 2 or not all(isinstance(value, (int, float)) for value in values):
+            raise InvalidCursor(cursor)
+        rank, post_id = values
+        sql += " AND (api_post_fts.rank > %s OR (api_post_fts.rank = %s AND api_post_fts.rowid > %s))"
+        params += [rank, rank, post_id]
+    sql += " ORDER BY api_post_fts.rank, api_post_fts.rowid LIMIT %s"
+    params.append(size + 1)
+
+    with connection.cursor() as db:
+        db.execute(sql, params)
+        hits = db.fetchall()
+
+    next_cursor = None
+    if len(hits) > size:
+        hits = hits[:size]
+        post_id, rank = hits[-1]
+        next_cursor = encode_cursor([rank, post_id])
+
+    posts = Post.objects.select_related("user__userprofile").in_bulk([post_id for post_id, _ in hits])
+    return [posts[post_id] for post_id, _ in hits if post_id in posts], next_cursor
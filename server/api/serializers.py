@@ -2,22 +2,45 @@ from rest_framework.serializers import ModelSerializer, SlugRelatedField, Serial
 from rest_framework import serializers
 from .models import Post, UserProfile, Comment, SavedPost
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.db.models import Count, Exists, Manager, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 
 
 
-#  User Profile Summary to send with user Serializer
-class UserProfileSummarySerializer(ModelSerializer):
+# Stored rendition metadata with absolute urls, [{"url", "width", "height", "size"}] smallest first
+class RenditionsField(serializers.Field):
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, renditions):
+        request = self.context.get("request")
+        result = []
+        for rendition in renditions or ():
+            url = default_storage.url(rendition["name"])
+            result.append({
+                "url": request.build_absolute_uri(url) if request else url,
+                "width": rendition["width"],
+                "height": rendition["height"],
+                "size": rendition["size"],
+            })
+        return result
 
-    followers_count = SerializerMethodField()
 
+#  User Profile Summary to send with user Serializer
+class UserProfileSummarySerializer(ModelSerializer):
+    profile_image_renditions = RenditionsField()
 
-    def get_followers_count(self, obj):
-        return obj.following.count()
     class Meta:
         model = UserProfile
-        fields = ["id", "followers_count", "profile_image", "is_verified"]
+        fields = [
+            "id", "followers_count", "profile_image", "profile_image_renditions", "profile_image_width",
+            "profile_image_height", "profile_image_placeholder", "profile_image_dominant_color", "is_verified",
+        ]
+        read_only_fields = ["followers_count", "profile_image_width", "profile_image_height", "profile_image_placeholder", "profile_image_dominant_color"]
 
 
 # User Serializer
@@ -43,79 +66,130 @@ class UserSummarySerializer(ModelSerializer):
 
 
 
+# Entry of a followers / following list, is_following is resolved for the whole page by the view
+class FollowListUserSerializer(UserSummarySerializer):
+    is_following = SerializerMethodField()
+
+    class Meta(UserSummarySerializer.Meta):
+        fields = UserSummarySerializer.Meta.fields + ["is_following"]
+
+    def get_is_following(self, obj):
+        return obj.id in self.context.get("viewer_following", ())
+
+
+
+
 #  Main User Profile Serializer
 class UserProfileSerializer(ModelSerializer):
-    followers_count = SerializerMethodField()
-    following_count = SerializerMethodField()
     user = UserSerializer(read_only=True)
     is_mine = SerializerMethodField()
-    is_following = SerializerMethodField()
-    posts_count = SerializerMethodField()
+    is_following = serializers.BooleanField(read_only=True)
+    posts_count = serializers.IntegerField(read_only=True)
+    profile_image_renditions = RenditionsField()
     
     class Meta:
         model = UserProfile
-        fields = ["id","is_verified", "bio", "location", "birth_date", "profile_image", "followers_count","following_count", "user", "is_mine", "is_following", "posts_count", "gender", "account_type"]
+        fields = ["id","is_verified", "bio", "location", "birth_date", "profile_image", "profile_image_renditions", "profile_image_width", "profile_image_height", "profile_image_placeholder", "profile_image_dominant_color", "followers_count","following_count", "user", "is_mine", "is_following", "posts_count", "gender", "account_type"]
+        read_only_fields = ["followers_count", "following_count", "profile_image_width", "profile_image_height", "profile_image_placeholder", "profile_image_dominant_color"]
+
+    # Profiles with the rest of the header counted in the same query, the serializer expects its rows to come from here
+    @staticmethod
+    def get_queryset(viewer):
+        follows = UserProfile.following.through.objects.order_by()
+        return UserProfile.objects.select_related("user").annotate(
+            posts_count=_count(Post.objects.order_by().filter(user_id=OuterRef("user_id")), "user_id"),
+            is_following=Exists(follows.filter(userprofile__user_id=viewer.id, user_id=OuterRef("user_id"))),
+        )
+
+    def get_is_mine(self, obj):
+        return obj.user_id == self.context.get("request").user.id
 
-    def get_following_count(self, obj):
-        return obj.following.count()
 
-    def get_followers_count(self, obj):
-        return User.objects.filter(userprofile__following=obj.user).count()
+def _count(queryset, group_by):
+    return Coalesce(Subquery(queryset.values(group_by).annotate(total=Count("pk")).values("total")), 0)
 
-    def get_is_following(self , obj):
-        req_user_id = self.context.get("request").user.id
-        
-        
-        return obj.user.following.filter(user_id=req_user_id).exists()
 
+# Per viewer flags for a page of posts, resolved with one query per flag instead of one per post
+class PostViewerState:
+    def __init__(self, post_ids=(), liked=(), saved=(), following=()):
+        self.post_ids = set(post_ids)
+        self.liked = set(liked)
+        self.saved = set(saved)
+        self.following = set(following)
 
-    def get_is_mine(self, obj):
-        return obj.user == self.context.get("request").user
+    @classmethod
+    def resolve(cls, posts, user):
+        post_ids = [post.id for post in posts]
+        author_ids = {post.user_id for post in posts if post.user_id is not None}
+        if not post_ids or not user.is_authenticated:
+            return cls(post_ids)
 
-    def get_posts_count(self, obj):
-        return Post.objects.filter(user=obj.user).count()
+        return cls(
+            post_ids,
+            liked=Post.likes.through.objects.filter(post_id__in=post_ids, user_id=user.id).values_list("post_id", flat=True),
+            saved=SavedPost.objects.filter(post_id__in=post_ids, user_profile__user_id=user.id).values_list("post_id", flat=True),
+            following=UserProfile.following.through.objects.filter(userprofile__user_id=user.id, user_id__in=author_ids).values_list("user_id", flat=True),
+        )
 
 
+class PostListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        posts = list(data.all() if isinstance(data, Manager) else data)
+        self.context["viewer_state"] = PostViewerState.resolve(posts, self.context["request"].user)
+        return super().to_representation(posts)
 
 
 # Post Serializer
 class PostSerializer(ModelSerializer):
-    likes_count = SerializerMethodField()
     is_liked = SerializerMethodField()
     is_mine = SerializerMethodField()
     is_following = SerializerMethodField()
     is_saved = SerializerMethodField()
     user = UserSerializer(read_only=True)
     user_id = SlugRelatedField(queryset=User.objects.all, slug_field="user", write_only=True)
+    image_renditions = RenditionsField()
 
     
     class Meta: 
         model = Post
-        exclude = ["likes", "tags"]
+        exclude = ["likes", "tags", "image_blob"]
+        read_only_fields = ["likes_count", "image_status", "image_width", "image_height", "image_placeholder", "image_dominant_color"]
+        list_serializer_class = PostListSerializer
+
+    # Resolved once for the whole page by PostListSerializer, or for the single post otherwise
+    def get_viewer_state(self, obj):
+        state = self.context.get("viewer_state")
+        if state is None or obj.id not in state.post_ids:
+            state = PostViewerState.resolve([obj], self.context["request"].user)
+            self.context["viewer_state"] = state
+        return state
 
     def get_is_saved(self, obj):
-        return obj.savedpost_set.filter(user_profile=self.context.get('request').user.userprofile).exists()
+        return obj.id in self.get_viewer_state(obj).saved
 
     def get_is_following(self, obj):
-        request = self.context.get('request')
-        user = request.user if request else None
-        if user:
-            following = user.userprofile.following.all()
-            return following.filter(id=obj.user.id).exists()
-        return False
-            
-
-    def get_likes_count(self, obj):
-        return obj.likes.count()
+        return obj.user_id in self.get_viewer_state(obj).following
 
     def get_is_liked(self , obj):
-        req_user_id = self.context.get("request").user.id
-        return obj.likes.filter(id=req_user_id).exists()
+        return obj.id in self.get_viewer_state(obj).liked
     
     def get_is_mine(self, obj):
-        return obj.user == self.context.get("request").user
+        return obj.user_id == self.context.get("request").user.id
 
        
+class CommentListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        comments = list(data.all() if isinstance(data, Manager) else data)
+        comment_ids = [comment.id for comment in comments]
+        liked = set(
+            Comment.likes.through.objects.filter(comment_id__in=comment_ids, user_id=self.context["request"].user.id)
+            .values_list("comment_id", flat=True)
+        )
+        # comment id -> liked by the viewer, for the whole page in one query
+        self.context["comments_liked"] = {comment_id: comment_id in liked for comment_id in comment_ids}
+        return super().to_representation(comments)
+
+
 # Comment serializer
 class CommentSerializer(ModelSerializer):
     user = StringRelatedField()
@@ -124,54 +198,29 @@ class CommentSerializer(ModelSerializer):
     post_id = serializers.IntegerField(source='post.id', read_only=True)
     post_user_id = serializers.IntegerField(source="post.user.id", read_only=True)
     user_profile = UserProfileSummarySerializer(source="user.userprofile",read_only=True)
-    replies_count = SerializerMethodField()
+    replies_count = serializers.IntegerField(read_only=True)
     reply_to_username = serializers.StringRelatedField(source='reply_to.username', read_only=True)
-    top_level_parent_id = serializers.SerializerMethodField()
+    top_level_parent_id = serializers.IntegerField(read_only=True)
 
     is_mine = serializers.SerializerMethodField()
     is_liked_by_me = serializers.SerializerMethodField()
-    likes_count = serializers.SerializerMethodField()
 
 
-    _parent_cache = {}
     class Meta:
         model = Comment
         fields = ['id', 'user_profile','top_level_parent_id', 'post', 'content', 'parent', 'reply_to', 'created_at', 'user',"replies_count", "reply_to_username", "user_id", "pinned", "is_mine", "is_liked_by_me", "likes_count", 'post_id', 'post_user_id']
+        read_only_fields = ["likes_count"]
+        list_serializer_class = CommentListSerializer
 
     def get_is_mine(self, obj):
-        return obj.user == self.context['request'].user
-
-    def get_likes_count(self, obj):
-        return obj.likes.count()
-
+        return obj.user_id == self.context['request'].user.id
 
     def get_is_liked_by_me(self, obj):
+        liked = self.context.get("comments_liked", {})
+        if obj.id in liked:
+            return liked[obj.id]
         return obj.likes.filter(id=self.context['request'].user.id).exists()
 
-    def get_replies_count(self, obj):
-        return self.get_all_replies_count(obj)
-
-    def get_all_replies_count(self, comment):
-        count = Comment.objects.filter(parent=comment).count()
-        for reply in Comment.objects.filter(parent=comment):
-            count += self.get_all_replies_count(reply)
-        return count    
-
-    def get_top_level_parent_id(self, obj):
-        if obj.parent is None:
-            # If the comment has no parent, it's the top-level parent comment
-            return obj.id
-        else:
-            # Check if the parent ID is in the cache
-            if obj.parent in self._parent_cache:
-                return self._parent_cache[obj.parent]
-            else:
-                parent_comment = Comment.objects.get(id=obj.parent.id)
-                top_level_parent_id = self.get_top_level_parent_id(parent_comment)
-                # Add the parent ID to the cache for future lookups
-                self._parent_cache[obj.parent] = top_level_parent_id
-                return top_level_parent_id
-
 
     def validate(self, data):
         if data.get('pinned', False) and data.get('parent', None) is not None:
@@ -186,14 +235,12 @@ class CommentSerializer(ModelSerializer):
         return data
 
 class SimplePostSerializer (ModelSerializer):
-    likes_count = SerializerMethodField()
     user = UserSummarySerializer()
+    image_renditions = RenditionsField()
     class Meta: 
         model = Post
-        fields = ['user', 'image', "likes_count", "title", "id"]
+        fields = ['user', 'image', "image_renditions", "image_status", "image_width", "image_height", "image_placeholder", "image_dominant_color", "likes_count", "title", "id"]
         # exclude = ["likes"]
-    def get_likes_count(self, obj):
-        return obj.likes.count()
                             
 # Saved post serializer 
 class SavedPostSerializer(ModelSerializer):
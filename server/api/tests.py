@@ -1,3 +1,718 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from . import autocomplete, follow_graph, follows, images, timelines
+from .models import VISIBILITY_CLOSE_FRIENDS, Comment, ImageBlob, ImageJob, Post, Tag, UserProfile
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def raw_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+class TagSlugTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("author")
+
+    def post(self, description):
+        return Post.objects.create(title="post", description=description, user=self.user)
+
+    def test_spelling_of_an_existing_slug_reuses_its_tag(self):
+        legacy = Tag.objects.create(name="sunset!")
+        for description in ["#sunset", "#sunset_", "#ＳＵＮＳＥＴ"]:
+            self.assertEqual(list(self.post(description).tags.all()), [legacy])
+        self.assertEqual(Tag.objects.count(), 1)
+
+    def test_tag_without_slug_is_dropped(self):
+        self.assertEqual(self.post("#_ #__").tags.count(), 0)
+        self.assertFalse(Tag.objects.filter(slug="").exists())
+
+    def test_explore_finds_tag_by_slug(self):
+        self.post("#Beach")
+        response = client_for(self.user).get(reverse("explore_tags", args=["BEACH"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user("author")
+        self.client = client_for(self.user)
+
+    def post(self, description, visibility="public"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(title="post", description=description, user=self.user, visibility=visibility)
+
+    def trending(self, window="1h"):
+        cache.clear()
+        response = self.client.get(reverse("explore_trending"), {"window": window})
+        return [(tag["name"], tag["count"]) for tag in response.data]
+
+    def test_public_posts_are_counted(self):
+        self.post("#cats #dogs")
+        self.post("#cats")
+        self.post("#dogs #birds", VISIBILITY_CLOSE_FRIENDS)
+        self.assertEqual(self.trending(), [("cats", 2), ("dogs", 1)])
+        self.assertEqual(self.client.get(reverse("explore_trending"), {"window": "2d"}).status_code, 400)
+
+    def test_deleted_and_edited_posts_stop_counting(self):
+        autocomplete.tags._index = None
+        self.addCleanup(setattr, autocomplete.tags, "_index", None)
+        first, second = self.post("#cats #dogs"), self.post("#cats")
+        autocomplete.tags.index
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.trending("7d"), [("cats", 1)])
+        self.assertEqual([(name, score) for _, name, score in autocomplete.tags.index.search("", 10)], [("cats", 1), ("dogs", 0)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.description = "#dogs"
+            second.save()
+        self.assertEqual(self.trending("7d"), [("dogs", 1)])
+
+
+class CursorTests(TestCase):
+    def setUp(self):
+        self.client = client_for(User.objects.create_user("reader"))
+
+    def test_malformed_cursor_values_are_rejected(self):
+        for values in [[{}, {}], [None, None], [[1], 2], ["not a date", 1]]:
+            for name in ["get_posts", "home_feed"]:
+                response = self.client.get(reverse(name), {"cursor": raw_cursor(values)})
+                self.assertEqual(response.status_code, 400, (name, values))
+
+    def test_garbage_cursor_is_rejected(self):
+        self.assertEqual(self.client.get(reverse("get_posts"), {"cursor": "%%%"}).status_code, 400)
+
+    def test_pages_follow_each_other(self):
+        author = User.objects.create_user("author")
+        for index in range(5):
+            Post.objects.create(title=f"post {index}", description="", user=author)
+
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            data = self.client.get(reverse("get_posts"), params).data
+            seen += [post["title"] for post in data["posts"]]
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f"post {index}" for index in reversed(range(5))])
+
+
+class CloseFriendsFanoutTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user("author")
+        self.followers = [User.objects.create_user(f"follower{index}") for index in range(3)]
+        for follower in self.followers:
+            follower.userprofile.following.add(self.author)
+        self.author.userprofile.close_friends.add(self.followers[0])
+
+    def post(self, title, visibility="public"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(title=title, description="", user=self.author, visibility=visibility)
+
+    def feed(self, user):
+        return [post["title"] for post in client_for(user).get(reverse("home_feed")).data["posts"]]
+
+    def test_close_friends_post_keeps_large_account_on_read(self):
+        original = timelines.FANOUT_MAX_FOLLOWERS
+        timelines.FANOUT_MAX_FOLLOWERS = 2
+        try:
+            self.post("public")
+            self.post("friends only", VISIBILITY_CLOSE_FRIENDS)
+        finally:
+            timelines.FANOUT_MAX_FOLLOWERS = original
+
+        self.assertTrue(UserProfile.objects.get(user=self.author).fanout_on_read)
+        self.assertEqual(self.feed(self.followers[1]), ["public"])
+        self.assertEqual(self.feed(self.followers[0]), ["friends only", "public"])
+
+    def test_close_friends_post_is_pushed_to_close_friends_only(self):
+        post = self.post("friends only", VISIBILITY_CLOSE_FRIENDS)
+        readers = set(post.timeline_entries.values_list("user_id", flat=True))
+        self.assertEqual(readers, {self.author.id, self.followers[0].id})
+
+
+class CommentVisibilityTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user("author")
+        self.stranger = User.objects.create_user("stranger")
+        post = Post.objects.create(title="post", description="", user=self.author, visibility=VISIBILITY_CLOSE_FRIENDS)
+        self.comment = Comment.objects.create(user=self.author, post=post, content="comment")
+        Comment.objects.create(user=self.author, post=post, content="reply", parent=self.comment)
+
+    def test_comments_of_hidden_posts_are_not_found(self):
+        client = client_for(self.stranger)
+        pk = self.comment.pk
+        self.assertEqual(client.get(reverse("comments_view", args=[pk])).status_code, 404)
+        self.assertEqual(client.post(reverse("like_comment", args=[pk])).status_code, 404)
+        self.assertEqual(client.post(reverse("dislike_comment", args=[pk])).status_code, 404)
+        self.assertEqual(client.put(reverse("update_co", args=[pk]), {"pinned": True}).status_code, 404)
+        self.assertEqual(client.delete(reverse("update_co", args=[pk])).status_code, 404)
+        self.assertEqual(Comment.objects.get(pk=pk).likes_count, 0)
+
+    def test_author_still_sees_them(self):
+        response = client_for(self.author).get(reverse("comments_view", args=[self.comment.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([reply["content"] for reply in response.data["replies"]], ["reply"])
+
+
+class ImageBlobTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user("author")
+
+    def upload(self, content):
+        return Post.objects.create(title="post", description="", user=self.user, image=ContentFile(content, name="upload.jpg"))
+
+    def test_same_bytes_share_one_counted_blob(self):
+        first, second = self.upload(b"same bytes"), self.upload(b"same bytes")
+        blob = ImageBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(first.image.name, second.image.name)
+
+        first.delete()
+        self.assertEqual(ImageBlob.objects.get().ref_count, 1)
+        second.delete()
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_upload_of_a_failed_blob_queues_it_again(self):
+        self.upload(b"broken")
+        ImageJob.objects.update(status=ImageJob.FAILED)
+        ImageBlob.objects.update(status="failed")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload(b"broken")
+        self.assertEqual(ImageBlob.objects.get().status, "pending")
+        self.assertEqual(list(ImageJob.objects.values_list("status", flat=True)), [ImageJob.PENDING])
+        self.assertEqual(set(Post.objects.values_list("image_status", flat=True)), {"pending"})
+
+    def test_post_payload_hides_the_blob(self):
+        post = self.upload(b"bytes")
+        response = client_for(self.user).get(reverse("get_post_by_id", args=[post.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("image_blob", response.data)
+
+
+def image_bytes(width, height, format):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "#336699").save(buffer, format)
+    return buffer.getvalue()
+
+
+class ImageJobTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user("author")
+
+    def process(self):
+        for blob_id in ImageJob.objects.values_list("object_id", flat=True):
+            images.process_blob(blob_id)
+
+    def test_profile_image_without_extension_is_resized(self):
+        profile = self.user.userprofile
+        profile.profile_image = ContentFile(image_bytes(800, 600, "PNG"), name="upload")
+        profile.save()
+        self.assertEqual(ImageJob.objects.count(), 1)
+
+        self.process()
+        profile.refresh_from_db()
+        self.assertEqual(profile.profile_image_blob.status, "ready")
+        with Image.open(profile.profile_image.path) as stored:
+            self.assertEqual((stored.format, stored.size), ("PNG", (500, 375)))
+
+    def test_renditions_are_listed_smallest_first(self):
+        post = Post.objects.create(title="post", description="", user=self.user, image=ContentFile(image_bytes(1200, 800, "JPEG"), name="upload.jpg"))
+        self.process()
+
+        renditions = client_for(self.user).get(reverse("get_post_by_id", args=[post.pk])).data["image_renditions"]
+        self.assertEqual([(rendition["width"], rendition["height"]) for rendition in renditions], [(150, 100), (320, 213), (640, 427), (1080, 720)])
+        for rendition in Post.objects.get(pk=post.pk).image_renditions:
+            with Image.open(f"{self.media_root}/{rendition['name']}") as stored:
+                self.assertEqual((stored.format, stored.width), ("WEBP", rendition["width"]))
+        with Image.open(Post.objects.get(pk=post.pk).image.path) as stored:
+            self.assertEqual((stored.format, stored.size), ("WEBP", (500, 333)))
+
+    @mock.patch("api.images.close_old_connections")
+    def test_failed_jobs_are_retried_then_given_up(self, _):
+        post = Post.objects.create(title="post", description="", user=self.user, image=ContentFile(b"not an image", name="upload.jpg"))
+        for attempt in range(1, images.MAX_ATTEMPTS + 1):
+            ImageJob.objects.update(available_at=timezone.now())
+            [job] = images.claim_jobs(10)
+            with self.assertLogs("api.images", "WARNING"):
+                self.assertFalse(images.run_job(job))
+            self.assertEqual(ImageJob.objects.get().attempts, attempt)
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.FAILED)
+        self.assertEqual(Post.objects.get(pk=post.pk).image_status, "failed")
+        self.assertEqual(images.claim_jobs(10), [])
+
+    @mock.patch("api.images.close_old_connections")
+    def test_done_jobs_are_deleted(self, _):
+        post = Post.objects.create(title="post", description="", user=self.user, image=ContentFile(image_bytes(600, 400, "JPEG"), name="upload.jpg"))
+        [job] = images.claim_jobs(10)
+        self.assertTrue(images.run_job(job))
+        self.assertFalse(ImageJob.objects.exists())
+        self.assertEqual(Post.objects.get(pk=post.pk).image_status, "ready")
+
+
+class GcMediaTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        user = User.objects.create_user("author")
+        self.kept = Post.objects.create(title="post", description="", user=user, image=ContentFile(b"kept", name="upload.jpg")).image.name
+        self.orphans = [self.write("post_images/old.jpg", age=48), self.write("renditions/post_images/old_150.webp", age=48)]
+        self.young = self.write("profile_images/young.jpg", age=1)
+        os.utime(f"{self.media_root}/{self.kept}", (0, 0))
+
+    def write(self, name, age):
+        path = f"{self.media_root}/{name}"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(b"orphan")
+        moment = time.time() - age * 3600
+        os.utime(path, (moment, moment))
+        return name
+
+    def exists(self, name):
+        return os.path.exists(f"{self.media_root}/{name}")
+
+    def test_only_old_unreferenced_files_are_deleted(self):
+        out = io.StringIO()
+        call_command("gc_media", "--dry-run", stdout=out)
+        self.assertTrue(all(self.exists(name) for name in self.orphans))
+        self.assertIn("would delete 2 orphans", out.getvalue())
+
+        call_command("gc_media", stdout=io.StringIO())
+        self.assertFalse(any(self.exists(name) for name in self.orphans))
+        self.assertTrue(self.exists(self.kept))
+        self.assertTrue(self.exists(self.young))
+
+
+class MediaTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        with open(f"{self.media_root}/file.txt", "wb") as file:
+            file.write(b"0123456789")
+
+    def test_nul_byte_is_not_found(self):
+        self.assertEqual(self.client.get("/media/post_images/a%00b.jpg").status_code, 404)
+
+    def test_path_outside_media_root_is_not_found(self):
+        self.assertEqual(self.client.get("/media/../settings.py").status_code, 404)
+
+    def test_conditional_and_range_requests(self):
+        response = self.client.get("/media/file.txt")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get("/media/file.txt", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        response = self.client.get("/media/file.txt", HTTP_RANGE="bytes=2-4")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"234")
+        self.assertEqual(self.client.get("/media/file.txt", HTTP_RANGE="bytes=20-").status_code, 416)
+
+    def test_unprocessed_blob_is_not_cached_as_immutable(self):
+        name = "post_images/" + "a" * 64 + ".jpg"
+        ImageBlob.objects.create(kind="post_image", sha256="a" * 64, name=name)
+        os.makedirs(f"{self.media_root}/post_images")
+        with open(f"{self.media_root}/{name}", "wb") as file:
+            file.write(b"raw upload")
+
+        self.assertEqual(self.client.get(f"/media/{name}")["Cache-Control"], "no-cache")
+        ImageBlob.objects.update(status="ready")
+        self.assertIn("immutable", self.client.get(f"/media/{name}")["Cache-Control"])
+
+
+class FollowCounterTests(TestCase):
+    def setUp(self):
+        self.a, self.b, self.c = (User.objects.create_user(name) for name in "abc")
+
+    def counts(self, user):
+        profile = UserProfile.objects.get(user=user)
+        return profile.followers_count, profile.following_count
+
+    def test_follow_and_unfollow_count_once(self):
+        client = client_for(self.a)
+        self.assertEqual(client.post(reverse("follow_user", args=[self.b.id])).status_code, 200)
+        self.assertEqual(client.post(reverse("follow_user", args=[self.b.id])).status_code, 400)
+        self.assertEqual(self.counts(self.b), (1, 0))
+        self.assertEqual(self.counts(self.a), (0, 1))
+
+        self.assertEqual(follows.unfollow(self.a.userprofile, [self.b.id, self.c.id]), [self.b.id])
+        self.assertEqual(follows.unfollow(self.a.userprofile, [self.b.id]), [])
+        self.assertEqual(self.counts(self.b), (0, 0))
+        self.assertEqual(self.counts(self.a), (0, 0))
+
+    def test_orm_remove_only_counts_existing_follows(self):
+        self.c.userprofile.following.add(self.b)
+        self.a.userprofile.following.remove(self.b)
+        self.b.following.remove(self.a.userprofile)
+        self.assertEqual(self.counts(self.b), (1, 0))
+
+        self.c.userprofile.following.remove(self.b, self.a)
+        self.assertEqual(self.counts(self.b), (0, 0))
+        self.assertEqual(self.counts(self.c), (0, 0))
+
+
+class FollowSuggestionTests(TestCase):
+    def setUp(self):
+        self.users = {name: User.objects.create_user(name) for name in ["me", "friend", "close", "x", "y", "z"]}
+        self.follow("me", "friend")
+        self.follow("friend", "x", "y", "me")
+        self.follow("close", "x", "z")
+        self.users["me"].userprofile.close_friends.add(self.users["close"])
+        # Built from the rows above on first use
+        follow_graph.holder._graph = None
+        self.addCleanup(setattr, follow_graph.holder, "_graph", None)
+
+    def follow(self, follower, *followed):
+        self.users[follower].userprofile.following.add(*(self.users[name] for name in followed))
+
+    def suggestions(self):
+        response = client_for(self.users["me"]).get(reverse("follow_suggestions"))
+        return [(user["username"], user["mutuals"]) for user in response.data["users"]]
+
+    def test_friends_of_friends_ranked_by_mutuals(self):
+        self.assertEqual(self.suggestions(), [("x", 2), ("y", 1), ("z", 1)])
+
+    def test_follows_after_the_build_are_applied(self):
+        self.suggestions()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.follow("me", "x")
+        self.assertEqual(self.suggestions(), [("y", 1), ("z", 1)])
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        for index in (autocomplete.users, autocomplete.tags):
+            index._index = None
+            self.addCleanup(setattr, index, "_index", None)
+
+    def test_users_ranked_by_followers(self):
+        alice, alan, bob = (User.objects.create_user(name) for name in ["alice", "alan", "bob"])
+        bob.userprofile.following.add(alan)
+        client = client_for(bob)
+        self.assertEqual([user["username"] for user in client.get(reverse("autocomplete_users"), {"q": "@A"}).data], ["alan", "alice"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            alan.userprofile.following.add(alice)
+            bob.userprofile.following.remove(alan)
+            User.objects.create_user("albert")
+        self.assertEqual([user["username"] for user in client.get(reverse("autocomplete_users"), {"q": "al"}).data], ["alice", "alan", "albert"])
+
+    def test_tags_count_public_posts(self):
+        user = User.objects.create_user("author")
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(title="post", description="#cats #cars", user=user)
+            Post.objects.create(title="post", description="#cats", user=user)
+        response = client_for(user).get(reverse("autocomplete_tags"), {"q": "#ca"})
+        self.assertEqual([(tag["name"], tag["posts_count"]) for tag in response.data], [("cats", 2), ("cars", 1)])
+
+    def test_short_prefixes_are_ranked_when_built(self):
+        index = autocomplete.PrefixIndex([(1, "ab", 1), (2, "Ac", 5), (3, "b", 0)])
+        self.assertEqual(index._top, {"a": [2, 1], "ac": [2], "ab": [1], "b": [3]})
+        self.assertEqual([entry[1] for entry in index.search("A", 10)], ["Ac", "ab"])
+
+    def test_updates_during_a_rebuild_are_replayed(self):
+        holder = autocomplete.AutocompleteIndex(lambda: [(1, "ann", 0)])
+        holder.index
+
+        def load():
+            # Arrives after the load read its rows
+            holder.apply("upsert", 2, "anna")
+            return [(1, "ann", 0)]
+
+        holder._load_rows, holder._pending = load, []
+        holder._rebuild()
+        self.assertEqual([entry[1] for entry in holder.index.search("an", 10)], ["ann", "anna"])
+
+
+class CommentPathTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("author")
+        self.post = Post.objects.create(title="post", description="", user=self.user)
+
+    def comment(self, parent=None):
+        return Comment.objects.create(user=self.user, post=self.post, content="comment", parent=parent)
+
+    def test_path_lists_ancestors(self):
+        root = self.comment()
+        reply = self.comment(root)
+        nested = self.comment(reply)
+        self.assertEqual(nested.path, "/".join(f"{pk:010}" for pk in [root.pk, reply.pk, nested.pk]))
+        self.assertEqual(nested.ancestor_ids(), [root.pk, reply.pk])
+        self.assertEqual(list(root.descendants().order_by("path")), [reply, nested])
+        self.assertEqual(list(reply.descendants()), [nested])
+
+    def test_deep_thread_keeps_its_whole_path(self):
+        comment = None
+        for _ in range(30):
+            comment = self.comment(comment)
+        stored = Comment.objects.get(pk=comment.pk).path
+        self.assertEqual(len(stored.split("/")), 30)
+        self.assertGreater(len(stored), 255)
+
+
+class CommentThreadCounterTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user("author")
+        self.replier = User.objects.create_user("replier")
+        self.post = Post.objects.create(title="post", description="", user=self.author)
+        self.root = self.comment(self.author)
+        self.reply = self.comment(self.author, self.root)
+
+    def comment(self, user, parent=None):
+        return Comment.objects.create(user=user, post=self.post, content="comment", parent=parent)
+
+    def replies_count(self, comment):
+        return Comment.objects.get(pk=comment.pk).replies_count
+
+    def test_create_counts_replies_at_every_depth(self):
+        nested = self.comment(self.replier, self.reply)
+        self.assertEqual(Comment.objects.get(pk=nested.pk).top_level_parent_id, self.root.pk)
+        self.assertEqual(Comment.objects.get(pk=self.root.pk).top_level_parent_id, self.root.pk)
+        self.assertEqual((self.replies_count(self.root), self.replies_count(self.reply)), (2, 1))
+
+    def test_deleting_a_subtree_releases_it_once(self):
+        self.comment(self.replier, self.reply)
+        self.comment(self.author, self.root)
+        Comment.objects.get(pk=self.reply.pk).delete()
+        self.assertEqual(self.replies_count(self.root), 1)
+
+    def test_deleting_a_user_releases_their_replies(self):
+        self.comment(self.replier, self.reply)
+        self.comment(self.replier, self.root)
+        self.replier.delete()
+        self.assertEqual((self.replies_count(self.root), self.replies_count(self.reply)), (1, 0))
+
+
+class BulkFollowTests(TestCase):
+    def setUp(self):
+        self.me = User.objects.create_user("me")
+        self.others = [User.objects.create_user(f"user{index}") for index in range(3)]
+        self.client = client_for(self.me)
+
+    def bulk(self, data):
+        return self.client.post(reverse("bulk_follow"), data, format="json")
+
+    def relationships(self, ids):
+        return self.client.get(reverse("relationships"), {"ids": ids})
+
+    def test_follow_and_unfollow_in_one_request(self):
+        ids = [user.id for user in self.others]
+        self.others[2].userprofile.following.add(self.me)
+        response = self.bulk({"follow": ids[:2] + [9999]})
+        self.assertEqual(response.data, {"followed": ids[:2], "unfollowed": []})
+        self.assertEqual(self.bulk({"follow": [ids[2]], "unfollow": [ids[0], ids[1], ids[0]]}).data, {"followed": [ids[2]], "unfollowed": ids[:2]})
+        self.assertEqual(UserProfile.objects.get(user=self.me).following_count, 1)
+
+        response = self.relationships(",".join(map(str, ids)))
+        self.assertEqual(
+            [(row["id"], row["following"], row["followed_by"]) for row in response.data],
+            [(ids[0], False, False), (ids[1], False, False), (ids[2], True, True)],
+        )
+
+    def test_ids_must_be_integers(self):
+        for data in [{"follow": [True, 2]}, {"follow": [2.7]}, {"unfollow": ["2"]}, {"follow": 2}]:
+            self.assertEqual(self.bulk(data).status_code, 400, data)
+        for ids in ["1,x", "1.5", "1,,2", "-1", "²"]:
+            self.assertEqual(self.relationships(ids).status_code, 400, ids)
+        self.assertFalse(UserProfile.following.through.objects.exists())
+
+
+class LikeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("reader")
+        self.post = Post.objects.create(title="post", description="", user=User.objects.create_user("author"))
+        self.client = client_for(self.user)
+
+    def like(self, data=None):
+        response = self.client.post(reverse("like_post", args=[self.post.pk]), data, format="json")
+        return response.status_code, response.data.get("liked"), response.data.get("likes_count")
+
+    def test_setting_the_state_is_idempotent(self):
+        self.assertEqual(self.like({"liked": True}), (200, True, 1))
+        self.assertEqual(self.like({"liked": "true"}), (200, True, 1))
+        self.assertEqual(self.like({"liked": False}), (200, False, 0))
+        self.assertEqual(self.like({"liked": 0}), (200, False, 0))
+        self.assertEqual(self.post.likes.count(), 0)
+
+    def test_without_a_body_the_like_toggles(self):
+        self.assertEqual(self.like(), (200, True, 1))
+        self.assertEqual(self.like(), (200, False, 0))
+
+    def test_unrecognized_values_are_rejected(self):
+        self.like({"liked": True})
+        for value in ["yes", 2, 1.0, [], {}]:
+            self.assertEqual(self.like({"liked": value})[0], 400, value)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).likes_count, 1)
+
+
+class LikeCounterTests(TestCase):
+    def setUp(self):
+        self.readers = [User.objects.create_user(f"reader{index}") for index in range(3)]
+        author = User.objects.create_user("author")
+        self.post = Post.objects.create(title="post", description="", user=author)
+        self.comment = Comment.objects.create(user=author, post=self.post, content="comment")
+
+    def test_comment_likes_count_follows_the_likes(self):
+        for reader in self.readers:
+            client_for(reader).post(reverse("like_comment", args=[self.comment.pk]))
+        client_for(self.readers[0]).post(reverse("like_comment", args=[self.comment.pk]))
+        response = client_for(self.readers[1]).post(reverse("dislike_comment", args=[self.comment.pk]))
+        self.assertEqual(response.data["likes_count"], 2)
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).likes_count, 2)
+
+    def test_reconcile_counters_fixes_drift(self):
+        self.post.likes.add(*self.readers)
+        Post.objects.filter(pk=self.post.pk).update(likes_count=7)
+        Comment.objects.filter(pk=self.comment.pk).update(likes_count=1)
+
+        out = io.StringIO()
+        call_command("reconcile_counters", "post_likes", "comment_likes", "--dry-run", stdout=out)
+        self.assertIn("post_likes: 1 drifted rows", out.getvalue())
+        self.assertEqual(Post.objects.get(pk=self.post.pk).likes_count, 7)
+
+        call_command("reconcile_counters", stdout=io.StringIO())
+        self.assertEqual(Post.objects.get(pk=self.post.pk).likes_count, 3)
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).likes_count, 0)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("reader")
+        self.author = User.objects.create_user("author")
+        self.client = client_for(self.user)
+
+    def post(self, title, description="", visibility="public"):
+        return Post.objects.create(title=title, description=description, user=self.author, visibility=visibility)
+
+    def search(self, q, **params):
+        return self.client.get(reverse("search_posts"), {"q": q, **params}).data
+
+    def test_pages_cover_every_match_once(self):
+        for index in range(5):
+            self.post(f"mountain trip {index}", "mountain " * (index + 1))
+        self.post("beach day")
+
+        titles, cursor = [], None
+        while True:
+            data = self.search("mountain", limit=2, **({"cursor": cursor} if cursor else {}))
+            titles += [post["title"] for post in data["posts"]]
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(sorted(titles), [f"mountain trip {index}" for index in range(5)])
+        self.assertEqual(len(titles), 5)
+
+    def test_prefix_edits_and_visibility(self):
+        post = self.post("Sunset over the lake")
+        self.post("sunset for friends", visibility=VISIBILITY_CLOSE_FRIENDS)
+        self.assertEqual([p["title"] for p in self.search("sun")["posts"]], ["Sunset over the lake"])
+
+        post.title = "Sunrise"
+        post.save()
+        self.assertEqual(self.search("sunset")["posts"], [])
+        self.assertEqual(self.search('" OR *')["posts"], [])
+
+    def test_malformed_cursor_is_rejected(self):
+        response = self.client.get(reverse("search_posts"), {"q": "sun", "cursor": raw_cursor(["a", 1])})
+        self.assertEqual(response.status_code, 400)
+
+
+class FollowListTests(TestCase):
+    def setUp(self):
+        self.target = User.objects.create_user("target")
+        self.viewer = User.objects.create_user("viewer")
+        self.fans = [User.objects.create_user(f"fan{index}") for index in range(5)]
+        for fan in self.fans:
+            fan.userprofile.following.add(self.target)
+        self.viewer.userprofile.following.add(self.fans[3])
+        self.target.userprofile.following.add(self.fans[0])
+
+    def pages(self, name):
+        client, rows, cursor = client_for(self.viewer), [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            data = client.get(reverse(name, args=["target"]), params).data
+            rows += [(user["username"], user["is_following"]) for user in data["users"]]
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return rows
+
+    def test_followers_newest_first_with_viewer_state(self):
+        expected = [(fan.username, fan == self.fans[3]) for fan in reversed(self.fans)]
+        self.assertEqual(self.pages("user_followers"), expected)
+
+    def test_following(self):
+        self.assertEqual(self.pages("user_following"), [("fan0", False)])
+
+    def test_unknown_user(self):
+        response = client_for(self.viewer).get(reverse("user_followers", args=["nobody"]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ProfileSaveTests(TestCase):
+    def setUp(self):
+        User.objects.create_user("member")
+        self.user = User.objects.select_related("userprofile").get(username="member")
+
+    def profile_writes(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save()
+        return [query["sql"] for query in queries if 'UPDATE "api_userprofile"' in query["sql"]]
+
+    def test_unchanged_profile_is_not_written(self):
+        self.assertEqual(self.profile_writes(), [])
+        self.user.last_login = timezone.now()
+        self.assertEqual(self.profile_writes(), [])
+
+    def test_changed_fields_only_are_written(self):
+        self.user.userprofile.bio = "hello"
+        [sql] = self.profile_writes()
+        self.assertIn('"bio"', sql)
+        self.assertNotIn('"location"', sql)
+        self.assertEqual(UserProfile.objects.get(user=self.user).bio, "hello")
+        self.assertEqual(self.profile_writes(), [])
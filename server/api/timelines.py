@@ -0,0 +1,129 @@
+import random
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import VISIBILITY_CLOSE_FRIENDS, Post, TimelineEntry, UserProfile, post_visibility_filter
+from .pagination import decode_keyset_cursor, encode_cursor, keyset_filter
+
+
+# Entries kept per reader. Each fan-out trims about one in TRIM_EVERY of the timelines it writes,
+# so a timeline grows past the bound by about TRIM_EVERY entries at most, and
+# `manage.py trim_timelines` trims all of them exactly
+TIMELINE_MAX_LENGTH = getattr(settings, "TIMELINE_MAX_LENGTH", 800)
+TRIM_EVERY = getattr(settings, "TIMELINE_TRIM_EVERY", 50)
+# Authors with more followers than this are not fanned out, their followers pull their posts on read
+FANOUT_MAX_FOLLOWERS = getattr(settings, "TIMELINE_FANOUT_MAX_FOLLOWERS", 10000)
+# Recent posts copied into a timeline when its owner starts following someone
+BACKFILL_POSTS = getattr(settings, "TIMELINE_BACKFILL_POSTS", 20)
+
+BATCH_SIZE = 1000
+TRIM_BATCH_SIZE = 500
+
+FEED_ORDERING = ("-created", "-id")
+ENTRY_ORDERING = ("-created", "-post_id")
+
+
+def fanout_post(post):
+    if post.user_id is None:
+        return
+
+    # Authors always get their own posts
+    readers = [post.user_id]
+
+    # Whether the author is a large account depends on all their followers, whoever this post is for
+    followers = UserProfile.objects.filter(following=post.user_id).order_by().values_list("user_id", flat=True)
+    follower_ids = list(followers[:FANOUT_MAX_FOLLOWERS + 1])
+    fanout_on_read = len(follower_ids) > FANOUT_MAX_FOLLOWERS
+    UserProfile.objects.filter(user_id=post.user_id).exclude(fanout_on_read=fanout_on_read).update(fanout_on_read=fanout_on_read)
+
+    if not fanout_on_read:
+        if post.visibility == VISIBILITY_CLOSE_FRIENDS:
+            follower_ids = list(followers.filter(user__close_friends__user_id=post.user_id))
+        readers += follower_ids
+
+    entries = [TimelineEntry(user_id=reader_id, post_id=post.pk, created=post.created) for reader_id in readers]
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    trim_timelines([reader_id for reader_id in readers if random.random() * TRIM_EVERY < 1])
+
+
+# Called when follower_id starts following the users in followed_ids
+def backfill(follower_id, followed_ids):
+    pushed = UserProfile.objects.filter(user_id__in=followed_ids, fanout_on_read=False).values("user_id")
+    # The BACKFILL_POSTS newest posts of every followed account in one query, ranked per author
+    ranked = (
+        Post.objects.filter(post_visibility_filter(follower_id), user_id__in=pushed)
+        .annotate(position=Window(RowNumber(), partition_by=F("user_id"), order_by=[F("created").desc(), F("id").desc()]))
+        .values("id", "created", "position")
+    )
+    sql, params = ranked.query.sql_with_params()
+    recent = Post.objects.raw(f"SELECT id, created FROM ({sql}) ranked WHERE position <= %s", [*params, BACKFILL_POSTS])
+    entries = [TimelineEntry(user_id=follower_id, post_id=post.id, created=post.created) for post in recent]
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    if entries:
+        trim_timelines([follower_id])
+
+
+# Called when follower_id stops following the users in followed_ids
+def purge(follower_id, followed_ids):
+    TimelineEntry.objects.filter(user_id=follower_id, post__user_id__in=followed_ids).delete()
+
+
+def trim_timeline(user_id, max_length=TIMELINE_MAX_LENGTH):
+    entries = TimelineEntry.objects.filter(user_id=user_id)
+    boundary = list(entries.order_by(*ENTRY_ORDERING).values_list("created", "post_id")[max_length:max_length + 1])
+    if not boundary:
+        return 0
+
+    created, post_id = boundary[0]
+    deleted, _ = entries.filter(Q(created__lt=created) | Q(created=created, post_id__lte=post_id)).delete()
+    return deleted
+
+
+def trim_timelines(user_ids, max_length=TIMELINE_MAX_LENGTH):
+    """Drop the entries past `max_length` of several timelines, one statement per batch of them."""
+    table = TimelineEntry._meta.db_table
+    deleted = 0
+    for start in range(0, len(user_ids), TRIM_BATCH_SIZE):
+        batch = user_ids[start:start + TRIM_BATCH_SIZE]
+        placeholders = ", ".join(["%s"] * len(batch))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE id IN (SELECT id FROM ("
+                f"SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created DESC, post_id DESC) AS position"
+                f" FROM {table} WHERE user_id IN ({placeholders})"
+                f") ranked WHERE position > %s)",
+                [*batch, max_length],
+            )
+            deleted += cursor.rowcount
+    return deleted
+
+
+def read_home_timeline(user, cursor, size):
+    """
+    One page of the user's home feed, newest first. Pushed posts come from the
+    user's timeline entries, posts of followed fan-out-on-read accounts are pulled
+    from the posts table, and both are merged on (created, id).
+    Returns (posts, next_cursor).
+    """
+    # Visibility is checked on read as well, the audience of a post can change after its fan-out
+    entries = TimelineEntry.objects.filter(post_visibility_filter(user.id, prefix="post__"), user=user).select_related("post__user__userprofile")
+    large_accounts = user.userprofile.following.filter(userprofile__fanout_on_read=True).values("id")
+    pulled = Post.objects.visible_to(user).filter(user_id__in=large_accounts).select_related("user__userprofile")
+
+    if cursor:
+        values = decode_keyset_cursor(cursor, Post, FEED_ORDERING)
+        entries = entries.filter(keyset_filter(ENTRY_ORDERING, values))
+        pulled = pulled.filter(keyset_filter(FEED_ORDERING, values))
+
+    candidates = {entry.post.pk: entry.post for entry in entries.order_by(*ENTRY_ORDERING)[:size + 1]}
+    candidates.update((post.pk, post) for post in pulled.order_by(*FEED_ORDERING)[:size + 1])
+    posts = sorted(candidates.values(), key=lambda post: (post.created, post.pk), reverse=True)
+
+    next_cursor = None
+    if len(posts) > size:
+        posts = posts[:size]
+        next_cursor = encode_cursor([posts[-1].created, posts[-1].pk])
+    return posts, next_cursor
@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Tag, TagUsageBucket
+
+
+BUCKET_SECONDS = getattr(settings, "TRENDING_BUCKET_SECONDS", 300)
+# How long a computed trending list is served before it is summed again from the buckets
+CACHE_SECONDS = getattr(settings, "TRENDING_CACHE_SECONDS", 60)
+MAX_TRENDING = 50
+
+WINDOWS = {
+    "1h": timedelta(hours=1),
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+}
+
+
+def bucket_start(moment):
+    seconds = int(moment.timestamp())
+    return moment.replace(microsecond=0) - timedelta(seconds=seconds % BUCKET_SECONDS)
+
+
+# Called with the tag ids added to and removed from a post, two statements per direction
+def record_tag_usage(added, removed, moment=None):
+    bucket = bucket_start(moment or timezone.now())
+    for tag_ids, delta in ((added, 1), (removed, -1)):
+        if not tag_ids:
+            continue
+        TagUsageBucket.objects.bulk_create([TagUsageBucket(tag_id=tag_id, bucket=bucket) for tag_id in tag_ids], ignore_conflicts=True)
+        TagUsageBucket.objects.filter(tag_id__in=tag_ids, bucket=bucket).update(count=F("count") + delta)
+
+
+def compute_trending(window, limit=MAX_TRENDING):
+    since = bucket_start(timezone.now() - WINDOWS[window])
+    totals = (
+        TagUsageBucket.objects.filter(bucket__gte=since)
+        .order_by()
+        .values("tag_id")
+        .annotate(total=Sum("count"))
+        .filter(total__gt=0)
+        .order_by("-total", "tag_id")[:limit]
+    )
+    totals = list(totals)
+    tags = Tag.objects.in_bulk([row["tag_id"] for row in totals])
+    return [
+        {"name": tags[row["tag_id"]].name, "slug": tags[row["tag_id"]].slug, "count": row["total"]}
+        for row in totals
+        if row["tag_id"] in tags
+    ]
+
+
+def get_trending(window, limit):
+    trending = cache.get(f"trending_tags:{window}")
+    if trending is None:
+        trending = compute_trending(window)
+        cache.set(f"trending_tags:{window}", trending, CACHE_SECONDS)
+    return trending[:limit]
+
+
+def prune_buckets():
+    oldest = bucket_start(timezone.now() - max(WINDOWS.values()))
+    deleted, _ = TagUsageBucket.objects.filter(bucket__lt=oldest).delete()
+    return deleted
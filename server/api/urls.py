@@ -8,6 +8,7 @@ urlpatterns = [
     path("auth/logout/", views.logoutUser, name="logout_view"),
     path("auth/token/refresh/", views.refreshTokens, name="token_refresh"),
     path("posts/", views.getPosts, name="get_posts"),
+    path("feed/", views.getFeed, name="home_feed"),
     path("posts/<str:postId>", views.getPostById, name="get_post_by_id"),
     path("posts/like/<str:pk>", views.likePostView, name="like_post"),
     path("posts/user/<str:username>", views.getPostsByUser, name="get_all_posts_by_user"),
@@ -20,6 +21,10 @@ urlpatterns = [
     path("posts/comments/<str:commentId>/replies", views.getCommentReplies, name="comments_view"),
     #  Explore  
     path("explore/tag/<str:tag_name>", views.tagsView, name="explore_tags"),
+    path("explore/trending/", views.trendingTagsView, name="explore_trending"),
+    path("search/posts/", views.searchPostsView, name="search_posts"),
+    path("autocomplete/users/", views.autocompleteUsersView, name="autocomplete_users"),
+    path("autocomplete/tags/", views.autocompleteTagsView, name="autocomplete_tags"),
 
     path("comment/<str:pk>/like/", views.likeCommentView, name="like_comment"),
     path("comment/<str:pk>/dislike/", views.dislikeCommentView, name="dislike_comment"),
@@ -31,6 +36,11 @@ urlpatterns = [
     path("users/profile/<str:username>", views.getUserProfile, name="user_profile"),
     path("users/follow/<str:userid>", views.followUser, name="follow_user"),
     path("users/unfollow/<str:userid>", views.unFollowUser, name="unfollow_user"),
+    path("users/follows/", views.bulkFollowView, name="bulk_follow"),
+    path("users/relationships/", views.relationshipsView, name="relationships"),
+    path("users/suggestions/", views.followSuggestionsView, name="follow_suggestions"),
+    path("users/<str:username>/followers/", views.followersView, name="user_followers"),
+    path("users/<str:username>/following/", views.followingView, name="user_following"),
 
 
 
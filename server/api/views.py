@@ -4,8 +4,14 @@ from rest_framework.decorators import api_view, parser_classes, permission_class
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework import status
-from .models import Post, Comment, UserProfile, SavedPost, Tag
-from .serializers import PostSerializer, UserSerializer, UserProfileSerializer, CommentSerializer, SavedPostSerializer, SimplePostSerializer
+from .models import Post, Comment, UserProfile, SavedPost, Tag, COMMENT_RANKING, VISIBILITY_CHOICES, VISIBILITY_PUBLIC, normalize_tag
+from .serializers import PostSerializer, UserSerializer, UserProfileSerializer, CommentSerializer, SavedPostSerializer, SimplePostSerializer, FollowListUserSerializer, UserSummarySerializer
+from .pagination import paginate_keyset, get_page_size, InvalidCursor
+from .timelines import read_home_timeline
+from .likes import add_like, remove_like, toggle_like
+from .trending import WINDOWS as TRENDING_WINDOWS, get_trending
+from .search import search_posts, SearchUnavailable
+from . import autocomplete, follow_graph, follows
 
 from django.contrib.auth.models import User
 
@@ -18,17 +24,15 @@ from django.contrib.auth import authenticate
 from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
 from datetime import datetime, timedelta
-from django.db.models import Count
 
 @api_view(["GET", "PUT"])
 def getUserProfile(request, username):
     
     if(request.method == "GET"):
         try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
+            profile = UserProfileSerializer.get_queryset(request.user).get(user__username=username)
+        except UserProfile.DoesNotExist:
             return Response({"message": f"User '{username}' not found"}, status=404)
-        profile = user.userprofile
         serializer = UserProfileSerializer(profile, many=False, context={"request": request})
         return Response(serializer.data)
 
@@ -43,7 +47,8 @@ def getUserProfile(request, username):
 
         if serializer.is_valid():
             serializer.save()
-            return Response(serializer.data)
+            profile = UserProfileSerializer.get_queryset(request.user).get(pk=user_profile.pk)
+            return Response(UserProfileSerializer(profile, context={"request": request}).data)
         
         return Response(serializer.errors, status=400)
 
@@ -64,11 +69,9 @@ def followUser(request, userid):
         return Response({"error": "You cannot follow yourself."}, status=status.HTTP_400_BAD_REQUEST)
     
 
-    if request.user.userprofile.following.filter(id=userid).exists():
+    if not follows.follow(request.user.userprofile, [user_to_follow.id]):
         return Response({"error": "You are already following this user."}, status=status.HTTP_400_BAD_REQUEST)
-    
 
-    request.user.userprofile.following.add(user_to_follow)
     return Response({"success": "You are now following {}.".format(user_to_follow.username)})
 
 
@@ -87,14 +90,121 @@ def unFollowUser(request, userid):
     if request.user == user_to_unfollow:
         return Response({"error": "You cannot unfollow yourself."}, status=status.HTTP_400_BAD_REQUEST)
     
-    if not request.user.userprofile.following.filter(id=userid).exists():
+    if not follows.unfollow(request.user.userprofile, [user_to_unfollow.id]):
         return Response({"error": "You are not following this user."}, status=status.HTTP_400_BAD_REQUEST)
-    
-    request.user.userprofile.following.remove(user_to_unfollow)
+
     return Response({"success": "You have unfollowed {}.".format(user_to_unfollow.username)})
 
 
 
+# Follow and unfollow many users at once, {"follow": [user ids], "unfollow": [user ids]}
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def bulkFollowView(request):
+    try:
+        to_follow = _user_ids(request.data.get("follow", []))
+        to_unfollow = _user_ids(request.data.get("unfollow", []))
+    except TypeError:
+        return Response({"error": "follow and unfollow must be lists of user ids."}, status=status.HTTP_400_BAD_REQUEST)
+
+    if len(to_follow) + len(to_unfollow) > follows.MAX_BATCH:
+        return Response({"error": "At most {} users per request.".format(follows.MAX_BATCH)}, status=status.HTTP_400_BAD_REQUEST)
+    if to_follow & to_unfollow:
+        return Response({"error": "A user cannot be both followed and unfollowed."}, status=status.HTTP_400_BAD_REQUEST)
+
+    profile = request.user.userprofile
+    existing = set(User.objects.filter(id__in=to_follow).values_list("id", flat=True)) if to_follow else set()
+    followed = follows.follow(profile, existing)
+    unfollowed = follows.unfollow(profile, to_unfollow) if to_unfollow else []
+    return Response({"followed": followed, "unfollowed": unfollowed})
+
+
+# Relationship of the current user with up to follows.MAX_BATCH users, ?ids=1,2,3
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def relationshipsView(request):
+    ids = request.query_params.get("ids", "")
+    ids = ids.split(",") if ids else []
+    if not all(value.isascii() and value.isdigit() for value in ids):
+        return Response({"error": "ids must be a comma separated list of user ids."}, status=status.HTTP_400_BAD_REQUEST)
+    user_ids = {int(value) for value in ids}
+
+    if len(user_ids) > follows.MAX_BATCH:
+        return Response({"error": "At most {} users per request.".format(follows.MAX_BATCH)}, status=status.HTTP_400_BAD_REQUEST)
+
+    relations = follows.relationships(request.user.id, user_ids) if user_ids else {}
+    return Response([{"id": user_id, **relation} for user_id, relation in sorted(relations.items())])
+
+
+# User ids of a request body, JSON integers only: int() would turn true into 1 and 2.7 into 2
+def _user_ids(values):
+    if not isinstance(values, list) or not all(type(value) is int for value in values):
+        raise TypeError(values)
+    return set(values)
+
+
+
+# Followers / following lists, newest follow first, ?cursor=<next_cursor>&limit=<n>
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def followersView(request, username):
+    return _follow_list(request, username, followers=True)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def followingView(request, username):
+    return _follow_list(request, username, followers=False)
+
+
+def _follow_list(request, username, followers):
+    try:
+        target = User.objects.select_related("userprofile").get(username=username)
+    except User.DoesNotExist:
+        return Response({"error": "User does not exist."}, status=status.HTTP_404_NOT_FOUND)
+
+    through = UserProfile.following.through.objects
+    if followers:
+        rows = through.filter(user_id=target.id).select_related("userprofile__user")
+    else:
+        rows = through.filter(userprofile_id=target.userprofile.pk).select_related("user__userprofile")
+
+    try:
+        rows, next_cursor = paginate_keyset(rows, request, ordering=("-id",))
+    except InvalidCursor:
+        return Response({"msg": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+    users = [row.userprofile.user if followers else row.user for row in rows]
+    viewer_following = set(
+        through.filter(userprofile__user_id=request.user.id, user_id__in=[user.id for user in users]).values_list("user_id", flat=True)
+    )
+    serializer = FollowListUserSerializer(users, many=True, context={"request": request, "viewer_following": viewer_following})
+    return Response({"users": serializer.data, "next_cursor": next_cursor})
+
+
+
+# People you may know: friends of the people the user follows or marked as close friends,
+# ranked by mutual follows from the in-process follow graph
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def followSuggestionsView(request):
+    # Read before the call, the graph's lock is held while extra_sources is iterated
+    close_friends = list(request.user.userprofile.close_friends.values_list("id", flat=True))
+    ranked = follow_graph.holder.graph.suggestions(
+        request.user.id,
+        get_page_size(request, default=10, maximum=follow_graph.MAX_SUGGESTIONS),
+        extra_sources=close_friends,
+    )
+
+    users = User.objects.select_related("userprofile").in_bulk([user_id for user_id, _ in ranked])
+    suggestions = []
+    for user_id, mutuals in ranked:
+        if user_id in users:
+            suggestions.append({**UserSummarySerializer(users[user_id], context={"request": request}).data, "mutuals": mutuals})
+    return Response({"users": suggestions})
+
+
+
 @api_view(["POST"])
 def registerUser(request):
 
@@ -227,19 +337,35 @@ def getRoutes(request):
     return Response(routes)
 
 
+# Accepted values of "liked", as JSON or form fields
+LIKED_TRUE = (True, 1, "true", "1")
+LIKED_FALSE = (False, 0, "false", "0")
+
+
+# Compared with their types too, so 1.0 is not taken for 1
+def _is_one_of(value, accepted):
+    return any(type(value) is type(option) and value == option for option in accepted)
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def likePostView(request, pk):
     try:
-        post = Post.objects.get(pk=pk)
+        post = Post.objects.visible_to(request.user).only("id").get(pk=pk)
         user = request.user
 
-        if user in post.likes.all():
-            post.likes.remove(user)
-            return Response({"msg": "0"}, status=status.HTTP_200_OK)
+        # {"liked": true/false} sets the state idempotently, without a body the like is toggled
+        wanted = request.data.get("liked")
+        if wanted is None:
+            liked, likes_count = toggle_like(post, user)
+        elif _is_one_of(wanted, LIKED_TRUE):
+            liked, likes_count = add_like(post, user)
+        elif _is_one_of(wanted, LIKED_FALSE):
+            liked, likes_count = remove_like(post, user)
         else:
-            post.likes.add(user)
-            return Response({"msg" : "1"}, status=status.HTTP_200_OK)
+            return Response({"msg": "liked must be true or false"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"msg": "1" if liked else "0", "liked": liked, "likes_count": likes_count}, status=status.HTTP_200_OK)
 
     except Post.DoesNotExist:
         return Response({'msg': 'Post not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -252,13 +378,14 @@ def likePostView(request, pk):
 @permission_classes([IsAuthenticated])
 def getPosts(request):
     if request.method == "GET":
-        posts = Post.objects.all()
-        serializer = PostSerializer(posts, many=True, context={"request": request})
+        # Keyset pagination on (created, id), ?cursor=<next_cursor>&limit=<n>
+        try:
+            posts, next_cursor = paginate_keyset(Post.objects.visible_to(request.user).select_related("user__userprofile"), request, ordering=("-created", "-id"))
+        except InvalidCursor:
+            return Response({"msg": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # [print(field) for field  in Post._meta.get_fields()]
-        
-        
-        return Response(serializer.data)
+        serializer = PostSerializer(posts, many=True, context={"request": request})
+        return Response({"posts": serializer.data, "next_cursor": next_cursor})
 
     if request.method == "POST": 
 
@@ -267,10 +394,13 @@ def getPosts(request):
         title = data.get("title")
         description = data.get("description")
         image = data.get("image")
+        visibility = data.get("visibility") or VISIBILITY_PUBLIC
+        if visibility not in dict(VISIBILITY_CHOICES):
+            return Response({"msg": "Invalid visibility"}, status=status.HTTP_400_BAD_REQUEST)
 
         
         #TODO change user to request user
-        new_post = Post.objects.create(title=title, description=description, image=image, user=request.user)
+        new_post = Post.objects.create(title=title, description=description, image=image, user=request.user, visibility=visibility)
 
         serializer = PostSerializer(new_post, context={"request": request})
 
@@ -280,13 +410,26 @@ def getPosts(request):
 
 
 
+# Home feed, posts of the people the user follows
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def getFeed(request):
+    try:
+        posts, next_cursor = read_home_timeline(request.user, request.query_params.get("cursor"), get_page_size(request))
+    except InvalidCursor:
+        return Response({"msg": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = PostSerializer(posts, many=True, context={"request": request})
+    return Response({"posts": serializer.data, "next_cursor": next_cursor})
+
+
 # Get All Posts by a user 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def getPostsByUser(request, username):
     try:
         user = User.objects.get(username=username)
-        posts = Post.objects.filter(user=user)
+        posts = Post.objects.visible_to(request.user).filter(user=user).select_related("user__userprofile")
 
         return Response({"posts": PostSerializer(posts, many=True, context={"request": request}).data})
     except User.DoesNotExist:
@@ -299,7 +442,7 @@ def getPostsByUser(request, username):
 @permission_classes([IsAuthenticated])
 def getPostById(request, postId):
     try:
-        post = Post.objects.get(id=postId)
+        post = Post.objects.visible_to(request.user).select_related("user__userprofile").get(id=postId)
         return Response(PostSerializer(post, context={"request": request}).data)
     except Post.DoesNotExist:
         return Response({"msg": "Post does not exist"} , status=status.HTTP_404_NOT_FOUND)
@@ -314,12 +457,18 @@ def commentsView(request, postId):
         # Get All Comments in the post
         if request.method == "GET":
             try:
-                post = Post.objects.get(id=postId)
-                comments = Comment.objects.filter(post=post, parent=None).annotate(likes_count=Count('likes')).order_by('-pinned', '-likes_count', '-created_at')
+                post = Post.objects.visible_to(request.user).only("id").get(id=postId)
+                comments = Comment.objects.filter(post=post, parent=None).select_related("user__userprofile", "post__user", "reply_to")
+
+                # Pinned first, then most liked, then newest, ?cursor=<next_cursor>&limit=<n>
+                try:
+                    comments, next_cursor = paginate_keyset(comments, request, ordering=COMMENT_RANKING)
+                except InvalidCursor:
+                    return Response({"msg": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
 
                 serializer = CommentSerializer(comments, many=True, context={"request": request})
 
-                return Response({'comments': serializer.data})
+                return Response({'comments': serializer.data, "next_cursor": next_cursor})
 
                 
             except Post.DoesNotExist:
@@ -331,7 +480,7 @@ def commentsView(request, postId):
         # Post req to route
         
         if request.method == "POST":
-            post  = Post.objects.get(id=postId)
+            post  = Post.objects.visible_to(request.user).get(id=postId)
             print(request.user)
             print(request.data)
             comment = Comment(post=post, user=request.user)
@@ -356,37 +505,29 @@ def commentsView(request, postId):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def getCommentReplies(request, commentId):
-    comment = Comment.objects.get(id=commentId)
-    replies = Comment.objects.filter(parent=comment)
-    serializer = CommentSerializer(replies, many=True, context={"request": request})
-
-    def get_subchild_comments(comment_obj, comments_list):
-        subchild_comments = Comment.objects.filter(parent=comment_obj)
-        for subchild_comment in subchild_comments:
-            comments_list.append(subchild_comment)
-            get_subchild_comments(subchild_comment, comments_list)
+    try:
+        comment = Comment.objects.visible_to(request.user).get(id=commentId)
+    except Comment.DoesNotExist:
+        return Response({"msg": "Comment does not exist"}, status=status.HTTP_404_NOT_FOUND)
 
-    all_comments = []
-    for reply in replies:
-        all_comments.append(reply)
-        get_subchild_comments(reply, all_comments)
+    # The thread below the comment in display order, one range read on the path index per page
+    replies = comment.descendants().select_related("user__userprofile", "post__user", "reply_to")
+    try:
+        replies, next_cursor = paginate_keyset(replies, request, ordering=("path",), page_size=get_page_size(request, default=50))
+    except InvalidCursor:
+        return Response({"msg": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
 
-    serializer = CommentSerializer(all_comments, many=True, context={"request": request})
-    return Response(serializer.data)
+    serializer = CommentSerializer(replies, many=True, context={"request": request})
+    return Response({"replies": serializer.data, "next_cursor": next_cursor})
 
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def likeCommentView(request, pk):
     try:
-        comment = Comment.objects.get(pk=pk)
-        user = request.user
-
-        if not user in comment.likes.all():
-            comment.likes.add(user)
-            return Response({"msg": True}, status=status.HTTP_200_OK)
-
-        return Response()
+        comment = Comment.objects.visible_to(request.user).only("id").get(pk=pk)
+        liked, likes_count = add_like(comment, request.user)
+        return Response({"msg": True, "liked": liked, "likes_count": likes_count}, status=status.HTTP_200_OK)
 
     except Post.DoesNotExist:
         return Response({'msg': 'Post not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -399,14 +540,9 @@ def likeCommentView(request, pk):
 @permission_classes([IsAuthenticated])
 def dislikeCommentView(request, pk):
     try:
-        comment = Comment.objects.get(pk=pk)
-        user = request.user
-
-        if user in comment.likes.all():
-            comment.likes.remove(user)
-            return Response({"liked": False}, status=status.HTTP_200_OK)
-
-        return Response()
+        comment = Comment.objects.visible_to(request.user).only("id").get(pk=pk)
+        liked, likes_count = remove_like(comment, request.user)
+        return Response({"liked": liked, "likes_count": likes_count}, status=status.HTTP_200_OK)
 
     except Post.DoesNotExist:
         return Response({'msg': 'Post not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -419,7 +555,7 @@ def dislikeCommentView(request, pk):
 def commentUpdateView(request, pk):
     if request.method == "PUT":
         try:
-            comment = Comment.objects.get(id=pk)
+            comment = Comment.objects.visible_to(request.user).get(id=pk)
             if comment.user != request.user:
                 # Check if it is for pinning so that it can be pinned by the post user so the "Not yours error is avoided"
                 if request.data.get('pinned') is not None:
@@ -438,11 +574,11 @@ def commentUpdateView(request, pk):
 
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Comment.DoesNotExist:
-            return Response({"msg": "comment does not exist"}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({"msg": "comment does not exist"}, status=status.HTTP_404_NOT_FOUND)
 
     if request.method == "DELETE":
             try:
-                comment = Comment.objects.get(id=pk)
+                comment = Comment.objects.visible_to(request.user).get(id=pk)
                 if comment.user != request.user and comment.post.user != request.user:
                     return Response({"msg": "You are not allowed to delete this comment"}, status=status.HTTP_403_FORBIDDEN)
                 comment.delete()
@@ -457,7 +593,7 @@ def savedPostsView(request):
 
     if request.method == "GET": 
         # print([print(field) for field in UserProfile._meta.get_fields()])
-        saved_posts = user_profile.savedpost_set.all()
+        saved_posts = user_profile.savedpost_set.filter(post__in=Post.objects.visible_to(request.user))
         serializer = SavedPostSerializer(saved_posts, many=True, context={"request": request})
 
         return Response(serializer.data)
@@ -467,7 +603,7 @@ def savedPostsView(request):
         post_id = request.data.get("post_id")
 
         try:
-            post = Post.objects.get(id=post_id)
+            post = Post.objects.visible_to(request.user).get(id=post_id)
 
             # Remove the post if it's already saved, or save it otherwise
             saved_post, created = SavedPost.objects.get_or_create(user_profile=user_profile, post=post)
@@ -488,10 +624,64 @@ def savedPostsView(request):
 @permission_classes([IsAuthenticated])
 def tagsView(request, tag_name):
     try:
-        tag = Tag.objects.get(name=tag_name)
-        posts = tag.post_set.all()
+        tag = Tag.objects.get(slug=Tag.make_slug(normalize_tag(tag_name)))
+        posts = tag.post_set.visible_to(request.user)
         serializer = SimplePostSerializer(posts, many=True, context={"request": request})
         return Response(serializer.data)
     except Tag.DoesNotExist:
         return Response({"error": "Tag not found"}, status=status.HTTP_404_NOT_FOUND)
 
+
+# Trending tags over the last ?window=1h|24h|7d
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def trendingTagsView(request):
+    window = request.query_params.get("window", "24h")
+    if window not in TRENDING_WINDOWS:
+        return Response({"error": f"window must be one of {', '.join(TRENDING_WINDOWS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(get_trending(window, get_page_size(request, default=10)))
+
+
+# Full text search over post titles and descriptions, ?q=<text>&cursor=<next_cursor>&limit=<n>
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def searchPostsView(request):
+    try:
+        posts, next_cursor = search_posts(request.query_params.get("q", ""), request.query_params.get("cursor"), get_page_size(request), request.user)
+    except InvalidCursor:
+        return Response({"msg": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+    except SearchUnavailable:
+        return Response({"msg": "Search is not available"}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    serializer = PostSerializer(posts, many=True, context={"request": request})
+    return Response({"posts": serializer.data, "next_cursor": next_cursor})
+
+
+# Typeahead, answered from the in-process prefix indexes without touching the database
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def autocompleteUsersView(request):
+    prefix = request.query_params.get("q", "").strip().lstrip("@")
+    if not prefix:
+        return Response([])
+
+    matches = autocomplete.users.index.search(prefix, get_page_size(request, default=8, maximum=autocomplete.MAX_RESULTS))
+    return Response([
+        {"id": user_id, "username": username, "followers_count": followers_count}
+        for user_id, username, followers_count in matches
+    ])
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def autocompleteTagsView(request):
+    prefix = normalize_tag(request.query_params.get("q", ""))
+    if not prefix:
+        return Response([])
+
+    matches = autocomplete.tags.index.search(prefix, get_page_size(request, default=8, maximum=autocomplete.MAX_RESULTS))
+    return Response([
+        {"name": name, "slug": Tag.make_slug(name), "posts_count": posts_count}
+        for _, name, posts_count in matches
+    ])
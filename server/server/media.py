@@ -0,0 +1,152 @@
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from api.images import COPIED_FIELDS, RENDITIONS_DIR
+from api.models import IMAGE_READY, ImageBlob
+
+
+CACHE_SECONDS = getattr(settings, "MEDIA_CACHE_SECONDS", 1209600)
+IMMUTABLE_CACHE_SECONDS = 31536000
+# "X-Sendfile" (Apache, lighttpd) or "X-Accel-Redirect" (nginx) hands the file to the front
+# server, None streams it from Python. X-Accel-Redirect points at SENDFILE_PREFIX + the name,
+# an `internal` location aliased to MEDIA_ROOT.
+SENDFILE_HEADER = getattr(settings, "MEDIA_SENDFILE_HEADER", None)
+SENDFILE_PREFIX = getattr(settings, "MEDIA_SENDFILE_PREFIX", "/protected-media/")
+CHUNK_SIZE = 64 * 1024
+
+# Renditions are written once, by the job of the blob they are named after. The blob's own file
+# is rewritten in place by that job, so it is only immutable once the blob is ready.
+# Storage may have appended "_<7 random characters>" to a name that was taken.
+RENDITION_NAME = re.compile(rf"^{RENDITIONS_DIR}/[\w-]+/[0-9a-f]{{64}}(?:_[A-Za-z0-9]{{7}})?_\d+\.\w+$")
+BLOB_NAME = re.compile(r"^([\w-]+)/([0-9a-f]{64})(?:_[A-Za-z0-9]{7})?\.\w+$")
+# Upload directory -> blob kind
+BLOB_KINDS = {
+    model._meta.get_field(field).upload_to.path: kind for kind, (model, field, _) in COPIED_FIELDS.items()
+}
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def byte_range(header, size):
+    """
+    (start, end) inclusive of a single range `header` within `size` bytes, None to send the
+    whole file (no header, several ranges or a malformed one), or False if it is unsatisfiable.
+    """
+    match = RANGE_PATTERN.match(header.replace(" ", "")) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range, the last `last` bytes
+        if int(last) == 0:
+            return False
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def cache_control(path):
+    if RENDITION_NAME.match(path):
+        return f"public, max-age={IMMUTABLE_CACHE_SECONDS}, immutable"
+    match = BLOB_NAME.match(path)
+    if match is None or match[1] not in BLOB_KINDS:
+        return f"public, max-age={CACHE_SECONDS}, no-transform"
+    blob = ImageBlob.objects.filter(kind=BLOB_KINDS[match[1]], sha256=match[2], name=path).values_list("status", flat=True).first()
+    if blob == IMAGE_READY:
+        return f"public, max-age={IMMUTABLE_CACHE_SECONDS}, immutable"
+    # Still the raw upload, revalidated until its job has replaced it
+    return "no-cache"
+
+
+def read_range(path, start, length):
+    with open(path, "rb") as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve a file below MEDIA_ROOT with a strong ETag, 304s for If-None-Match / If-Modified-Since
+    and single byte ranges. Renditions and processed blobs are cached as immutable.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stats = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404()
+    if not stat.S_ISREG(stats.st_mode):
+        raise Http404()
+
+    # Changes whenever the file is rewritten, so it is the same for the same bytes
+    etag = f'"{stats.st_mtime_ns:x}-{stats.st_size:x}"'
+    last_modified = int(stats.st_mtime)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control(path),
+    }
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        for header in ("ETag", "Last-Modified", "Cache-Control"):
+            response.headers[header] = headers[header]
+        return response
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or "application/octet-stream"
+
+    if SENDFILE_HEADER:
+        # The front server does the reading, and the ranges
+        response = HttpResponse(content_type=content_type, headers=headers)
+        if SENDFILE_HEADER.lower() == "x-accel-redirect":
+            response[SENDFILE_HEADER] = SENDFILE_PREFIX.rstrip("/") + "/" + path
+        else:
+            response[SENDFILE_HEADER] = full_path
+        return response
+
+    # A range only applies if the copy the client has is still this one
+    if_range = request.META.get("HTTP_IF_RANGE")
+    requested = request.META.get("HTTP_RANGE")
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        requested = None
+    span = byte_range(requested, stats.st_size)
+
+    if span is False:
+        response = HttpResponse(status=416, headers=headers)
+        response["Content-Range"] = f"bytes */{stats.st_size}"
+        return response
+    if span is None:
+        response = FileResponse(open(full_path, "rb"), content_type=content_type, headers=headers)
+    else:
+        start, end = span
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            read_range(full_path, start, length) if request.method == "GET" else (),
+            status=206, content_type=content_type, headers=headers,
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{stats.st_size}"
+        response["Content-Length"] = str(length)
+    if encoding:
+        response["Content-Encoding"] = encoding
+    return response
@@ -212,3 +212,46 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+
+# Home timelines. Fill them for existing accounts once with `manage.py backfill_timelines`,
+# fan-outs trim them as they go and `manage.py trim_timelines` (daily) trims them exactly
+
+TIMELINE_MAX_LENGTH = 800
+TIMELINE_FANOUT_MAX_FOLLOWERS = 10000
+TIMELINE_BACKFILL_POSTS = 20
+TIMELINE_TRIM_EVERY = 50
+
+
+# Trending tags
+
+TRENDING_BUCKET_SECONDS = 300
+TRENDING_CACHE_SECONDS = 60
+
+
+# Autocomplete
+
+AUTOCOMPLETE_REBUILD_SECONDS = 900
+
+
+# Follow suggestions
+
+FOLLOW_GRAPH_REBUILD_SECONDS = 900
+
+
+# Image processing, run the worker with `manage.py process_images`
+
+IMAGE_WORKERS = 2
+IMAGE_JOB_MAX_ATTEMPTS = 5
+IMAGE_JOB_RETRY_SECONDS = 30
+IMAGE_JOB_LOCK_SECONDS = 600
+IMAGE_RENDITION_WIDTHS = [150, 320, 640, 1080]
+IMAGE_PROFILE_RENDITION_WIDTHS = [48, 150, 320]
+
+
+# Media serving, see server/media.py. Set MEDIA_SENDFILE_HEADER to "X-Accel-Redirect" (nginx,
+# with an internal location at MEDIA_SENDFILE_PREFIX aliased to MEDIA_ROOT) or "X-Sendfile"
+# (Apache mod_xsendfile) to let the front server send the files
+
+MEDIA_CACHE_SECONDS = 1209600
+MEDIA_SENDFILE_HEADER = None
+MEDIA_SENDFILE_PREFIX = "/protected-media/"
@@ -2,29 +2,12 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
-from django.views.static import serve
+
+from .media import serve_media
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("api/", include("api.urls"))
+    path("api/", include("api.urls")),
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", serve_media, name="media"),
 ]
-
-CACHE_CONTROL_HEADER = 'max-age=1209600, no-transform'
-
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-else:
-    urlpatterns += [
-        path('media/<path:path>', serve, {
-            'document_root': settings.MEDIA_ROOT,
-            'show_indexes': False,
-            'cache_timeout': 1209600,  # 2 weeks
-            'xsendfile': False,
-            'http_headers': {
-                'Cache-Control': 'max-age=1209600, no-transform',
-            },
-        }),
-    ]
\ No newline at end of file